@@ -1,13 +1,40 @@
 # app.py
-from flask import Flask, session, redirect, url_for
+from flask import Flask, session, redirect, url_for, request
 import os
 
 def create_app():
     app = Flask(__name__)
     app.secret_key = os.urandom(24).hex()
+    
+    from config import TRUSTED_PROXY_HOPS
+    if TRUSTED_PROXY_HOPS:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+    import metrics
+    from config import METRICS_ALLOWED_IPS
+    metrics.init_app(app, allowed_ips=METRICS_ALLOWED_IPS)
 
-    from dal import get_like_status
+    import assets
+    from config import COMPRESS_MIN_SIZE, COMPRESS_LEVEL
+    assets.init_app(app, os.path.join(app.root_path, 'static'),
+                    compress_min_size=COMPRESS_MIN_SIZE, compress_level=COMPRESS_LEVEL)
+
+    from dal import get_connection, get_like_status, count_pending_invitations, mark_write
+    from changefeed import feed
+    feed.start(get_connection)
+    
+    @app.before_request
+    def pin_writers_to_primary():
+        if request.method == 'POST':
+            mark_write()
     app.jinja_env.globals['get_like_status'] = get_like_status
+    
+    @app.context_processor
+    def inject_pending_invitations():
+        if session.get('role') == 'student' and session.get('user_id'):
+            return {'pending_invitation_count': count_pending_invitations(session['user_id'])}
+        return {}
 
     from pages import login, profile, matching, admin
     app.register_blueprint(login.bp)
@@ -24,6 +51,14 @@ def create_app():
         session.clear()
         return redirect(url_for('login.login_form'))
     
+    from profiler import profiler
+    from config import PROFILER_DIR
+    profiler.init_app(app, PROFILER_DIR)
+    
+    import warmup
+    from config import TEMPLATE_BYTECODE_CACHE_DIR, WARMUP_ON_START
+    warmup.init_app(app, bytecode_cache_dir=TEMPLATE_BYTECODE_CACHE_DIR, warmup=WARMUP_ON_START)
+    
     return app
 
 if __name__ == '__main__':
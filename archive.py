@@ -0,0 +1,58 @@
+# archive.py
+"""Hot/cold table pairs and reads that span both.
+
+Rows that no longer change (unliked likes, rejected or cancelled invitations,
+resolved reports) are moved by jobs/archive_cold_rows.py into an ``_archive``
+table with the same columns plus ``archived_at``. The row keeps its id.
+
+Code that only deals with live state keeps reading the hot table. History
+views call ``union_with_archive``, which runs the same SELECT against both
+tables in one statement. Each branch is ordered and limited on its own
+indexes before the outer merge, so a page read costs two index range scans
+instead of a scan of the whole union.
+"""
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class ArchiveSpec(NamedTuple):
+    table: str
+    archive: str
+    columns: str            # copied as-is, in this order
+    cold: str               # rows that will not change any more
+    cold_since: str         # column holding when the row went cold
+    archived_statuses: Tuple[str, ...]
+
+
+ARCHIVES = {
+    'likes': ArchiveSpec(
+        'likes', 'likes_archive',
+        'id, from_student_id, to_student_id, status, created_at, updated_at',
+        "status = 'unliked'", 'updated_at', ('unliked',)),
+    'invitations': ArchiveSpec(
+        'invitations', 'invitations_archive',
+        'id, from_student_id, to_student_id, status, created_at, updated_at',
+        "status IN ('rejected', 'cancelled')", 'updated_at', ('rejected', 'cancelled')),
+    'reports': ArchiveSpec(
+        'reports', 'reports_archive',
+        'id, reporter_id, reported_id, reason, description, status, created_at, resolved_at',
+        "status = 'resolved'", 'resolved_at', ('resolved',)),
+}
+
+
+def union_with_archive(table: str, select_sql: str, params: List, order_by: str,
+                       limit: Optional[int] = None, status: Optional[str] = None) -> Tuple[str, List]:
+    """Extend ``select_sql`` (with a ``{table}`` placeholder) to cover the archive.
+
+    ``order_by`` must name select-list columns so it works inside each branch
+    and on the merged result. When ``status`` is a status that never gets
+    archived, only the hot table is read.
+    """
+    spec = ARCHIVES[table]
+    branch = select_sql + " ORDER BY " + order_by + (" LIMIT %s" if limit else "")
+    branch_params = list(params) + ([limit] if limit else [])
+    if status and status not in spec.archived_statuses:
+        return branch.format(table=spec.table), branch_params
+
+    sql = (f"({branch.format(table=spec.table)}) UNION ALL ({branch.format(table=spec.archive)})"
+           f" ORDER BY {order_by}" + (" LIMIT %s" if limit else ""))
+    return sql, branch_params + branch_params + ([limit] if limit else [])
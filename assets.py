@@ -0,0 +1,140 @@
+# assets.py
+"""Fingerprinted static assets and response compression.
+
+At startup every file under ``static/`` is read once, hashed and precompressed.
+Templates link to ``asset_url('css/search.css')``, which resolves to
+``/assets/css/search.<hash>.css``; since the name changes whenever the content
+does, those responses are marked immutable and cached by browsers for a year.
+
+Dynamic text responses (rendered HTML, JSON) are compressed on the way out when
+the client accepts it. Brotli is used if the ``brotli`` package is installed,
+gzip otherwise.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, NamedTuple, Optional
+
+from flask import Response, abort, request
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+FAR_FUTURE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+
+class Asset(NamedTuple):
+    mimetype: str
+    etag: str
+    body: bytes
+    gzip: Optional[bytes]
+    br: Optional[bytes]
+
+
+_assets: Dict[str, Asset] = {}   # fingerprinted path -> asset
+_urls: Dict[str, str] = {}       # logical path -> fingerprinted path
+
+
+def _fingerprint(path: str, digest: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def _compress(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def load(static_dir: str) -> None:
+    """Hash and precompress every file below ``static_dir``."""
+    _assets.clear()
+    _urls.clear()
+    for dirpath, _, filenames in os.walk(static_dir):
+        for filename in filenames:
+            full = os.path.join(dirpath, filename)
+            path = os.path.relpath(full, static_dir).replace(os.sep, '/')
+            with open(full, 'rb') as f:
+                body = f.read()
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            compressible = mimetype.startswith(COMPRESSIBLE_TYPES)
+            _urls[path] = _fingerprint(path, digest)
+            _assets[_urls[path]] = Asset(
+                mimetype=mimetype,
+                etag=digest,
+                body=body,
+                gzip=_compress(body, 'gzip', 9) if compressible else None,
+                br=_compress(body, 'br', 11) if compressible and brotli else None,
+            )
+
+
+def asset_url(path: str) -> str:
+    fingerprinted = _urls.get(path)
+    if fingerprinted is None:
+        print(f"[ASSETS ERROR] Unknown asset: {path}")
+        fingerprinted = path
+    return '/assets/' + fingerprinted
+
+
+def _accepted_encoding() -> Optional[str]:
+    accepted = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def init_app(app, static_dir: str, compress_min_size: int = 500, compress_level: int = 6) -> None:
+    """Register ``asset_url``, the ``/assets`` route and response compression."""
+    load(static_dir)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.route('/assets/<path:filename>')
+    def serve_asset(filename):
+        asset = _assets.get(filename)
+        if asset is None:
+            abort(404)
+        if request.if_none_match.contains(asset.etag):
+            response = Response(status=304)
+        else:
+            encoding = _accepted_encoding()
+            body = asset.body
+            if encoding == 'br' and asset.br is not None:
+                body = asset.br
+            elif encoding and asset.gzip is not None:
+                body, encoding = asset.gzip, 'gzip'
+            else:
+                encoding = None
+            response = Response(body, mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(asset.etag)
+        response.headers['Cache-Control'] = FAR_FUTURE
+        response.vary.add('Accept-Encoding')
+        return response
+
+    @app.after_request
+    def compress_response(response):
+        if (request.endpoint == 'serve_asset'
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+                or response.mimetype == 'text/event-stream'):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _accepted_encoding()
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < compress_min_size:
+            return response
+        response.set_data(_compress(body, encoding, compress_level))
+        response.headers['Content-Encoding'] = encoding
+        return response
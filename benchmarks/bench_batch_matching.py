@@ -0,0 +1,42 @@
+# benchmarks/bench_batch_matching.py
+"""Time the batch matching job on synthetic data, without a database.
+
+Students get 8 interest tags out of 128 with skewed popularity (a few tags are
+held by a large share of students, as hobbies are in the mock data) and about
+5 likes each. Scoring and assignment run exactly as in jobs/batch_matching.py;
+only loading and writing are skipped.
+
+    python benchmarks/bench_batch_matching.py [students] [workers]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from jobs.batch_matching import MatchData, run  # noqa: E402
+
+TAGS = 128
+TAGS_PER_STUDENT = 8
+LIKES_PER_STUDENT = 5
+
+
+def synthetic(n: int, seed: int = 1) -> MatchData:
+    rng = random.Random(seed)
+    ids = [f"{58000000 + i:08d}" for i in range(n)]
+    weights = [1 / (rank + 1) for rank in range(TAGS)]
+    tags = {sid: frozenset(rng.choices(range(TAGS), weights, k=TAGS_PER_STUDENT)) for sid in ids}
+    likes = {sid: set(rng.sample(ids, LIKES_PER_STUDENT)) - {sid} for sid in ids}
+    return MatchData(tags, likes, {})
+
+
+def main(n: int = 100_000, workers: int = None):
+    start = time.perf_counter()
+    data = synthetic(n)
+    print(f"generated {n} students in {time.perf_counter() - start:.1f}s, {os.cpu_count()} CPUs")
+    stats = run(data, None, workers=workers, time_budget=3600)
+    print(stats)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
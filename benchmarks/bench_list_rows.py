@@ -0,0 +1,75 @@
+# benchmarks/bench_list_rows.py
+"""Compare full ``s.*`` dict rows with projected StudentCard rows for search pages.
+
+Uses data/mock/student.csv, so no database is needed. Wire bytes are estimated
+from MySQL's text protocol: each row value is sent as a length-prefixed string,
+and each result set starts with one column definition packet per column
+(roughly 40 bytes plus the table and column names).
+
+    python benchmarks/bench_list_rows.py [rows_per_page]
+"""
+import csv
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from rows import StudentCard  # noqa: E402
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'mock', 'student.csv')
+
+
+def load_rows():
+    with open(CSV_PATH, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def wire_bytes(columns, rows):
+    header = sum(40 + len('student') + len(c) for c in columns)
+    body = 0
+    for row in rows:
+        body += 4  # packet header
+        for value in row:
+            encoded = str(value).encode('utf-8') if value not in (None, '') else b''
+            body += len(encoded) + (1 if len(encoded) < 251 else 3)
+    return header + body
+
+
+def measure(build):
+    tracemalloc.start()
+    rows = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, size
+
+
+def main():
+    per_page = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    source = load_rows()
+    pages = [source[i:i + per_page] for i in range(0, len(source), per_page)]
+    all_columns = list(source[0].keys())
+
+    # rows are re-read inside each measurement so retained values are counted, as
+    # they would be when a cursor decodes them
+    def paged(rows):
+        return [rows[i:i + per_page] for i in range(0, len(rows), per_page)]
+
+    full, full_mem = measure(lambda: paged(load_rows()))
+    card, card_mem = measure(lambda: paged([
+        StudentCard(r['student_id'], r['name'], r['nickname'], r['college'],
+                    int(r['year_of_study']), r['major'], r['bio'][:200])
+        for r in load_rows()
+    ]))
+
+    full_wire = sum(wire_bytes(all_columns, [list(r.values()) for r in page]) for page in full)
+    card_wire = sum(wire_bytes(StudentCard._fields, page) for page in card)
+
+    print(f"{len(source)} students, {len(pages)} pages of {per_page}")
+    print(f"{'':12}{'bytes/page (wire)':>20}{'python bytes/page':>20}")
+    print(f"{'dict s.*':12}{full_wire / len(pages):>20.0f}{full_mem / len(pages):>20.0f}")
+    print(f"{'StudentCard':12}{card_wire / len(pages):>20.0f}{card_mem / len(pages):>20.0f}")
+    print(f"reduction: wire {1 - card_wire / full_wire:.0%}, memory {1 - card_mem / full_mem:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_page_bytes.py
+"""Bytes sent per page view for the main routes, before and after asset extraction.
+
+Templates are rendered with placeholder context (no database is needed). The
+"before" page is reconstructed by inlining each linked stylesheet back into a
+``<style>`` block, which is what the templates used to send. "After" counts the
+compressed HTML plus, on a first visit only, the compressed stylesheets; repeat
+visits get the stylesheets from the browser cache.
+
+    python benchmarks/bench_page_bytes.py [gzip|br]
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from flask import Flask, render_template, session  # noqa: E402
+from jinja2 import ChainableUndefined  # noqa: E402
+
+import assets  # noqa: E402
+from config import COMPRESS_LEVEL  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+LINK_RE = re.compile(r'<link rel="stylesheet" href="/assets/([^"]+)">')
+
+PAGES = [
+    ('login', 'login.html', None, {}),
+    ('register', 'register.html', None, {}),
+    ('profile', 'profile.html', 'student', {}),
+    ('search', 'matching/search.html', 'student', {'students': [], 'filters': {}}),
+    ('detail', 'matching/detail.html', 'student', {}),
+    ('history', 'matching/history.html', 'student', {'sent': [], 'received': []}),
+    ('admin dashboard', 'admin/dashboard.html', 'admin', {}),
+    ('admin users', 'admin/users.html', 'admin', {'users': [], 'colleges': (), 'identities': ()}),
+    ('admin reports', 'admin/reports.html', 'admin', {'reports': []}),
+]
+
+
+def build_app():
+    app = Flask('bench', root_path=ROOT, template_folder=os.path.join(ROOT, 'templates'))
+    app.secret_key = 'bench'
+    app.jinja_env.undefined = ChainableUndefined
+    app.jinja_env.globals['get_like_status'] = lambda *a: False
+    assets.load(os.path.join(ROOT, 'static'))
+    app.jinja_env.globals['asset_url'] = assets.asset_url
+    for endpoint in ('login.login_form', 'login.register', 'login.login',
+                     'profile.profile', 'profile.edit_profile', 'profile.settings',
+                     'profile.change_password', 'matching.search_matches',
+                     'matching.view_student', 'matching.invitation_history',
+                     'admin.dashboard', 'admin.user_management', 'admin.tag_management',
+                     'admin.report_management', 'admin.moderation_queue',
+                     'admin.profiler_control', 'logout', 'index'):
+        app.add_url_rule('/' + endpoint.replace('.', '/'), endpoint)
+    # url_for() with unknown endpoints or arguments should not abort the run
+    app.url_build_error_handlers.append(lambda error, endpoint, values: '#')
+    return app
+
+
+def main(encoding='gzip'):
+    if encoding == 'br' and assets.brotli is None:
+        sys.exit("brotli is not installed")
+    app = build_app()
+    print(f"{'page':<16} {'before':>8} {'first':>8} {'repeat':>8}  (bytes, {encoding} level {COMPRESS_LEVEL})")
+    for name, template, role, context in PAGES:
+        with app.test_request_context('/'):
+            if role:
+                session['role'], session['user_id'] = role, 'bench'
+            html = render_template(template, **context)
+        css = [assets._assets[path].body for path in LINK_RE.findall(html)]
+
+        inline_html = LINK_RE.sub(
+            lambda m: '<style>\n' + assets._assets[m.group(1)].body.decode() + '</style>', html)
+        before = len(inline_html.encode())
+        html_sent = len(assets._compress(html.encode(), encoding, COMPRESS_LEVEL))
+        css_sent = sum(len(assets._compress(body, encoding, 11 if encoding == 'br' else 9))
+                       for body in css)
+        print(f"{name:<16} {before:>8} {html_sent + css_sent:>8} {html_sent:>8}")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
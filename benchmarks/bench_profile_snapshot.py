@@ -0,0 +1,109 @@
+# benchmarks/bench_profile_snapshot.py
+"""Time searches against a profile snapshot of synthetic students, without a database.
+
+Builds a snapshot in a temporary directory, maps it and runs the search
+page's common filter combinations. Each result is checked against a plain
+Python scan of the same rows.
+
+    python benchmarks/bench_profile_snapshot.py [students]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from cohort_import import COLLEGES, IDENTITIES  # noqa: E402
+from profile_snapshot import Snapshot, SnapshotRow, publish_snapshot  # noqa: E402
+
+MAJORS = [f"Major {i}" for i in range(60)]
+HOMETOWNS = [f"Town {i}" for i in range(300)]
+MBTI = ['INTJ', 'INTP', 'ENTJ', 'ENTP', 'INFJ', 'INFP', 'ENFJ', 'ENFP',
+        'ISTJ', 'ISFJ', 'ESTJ', 'ESFJ', 'ISTP', 'ISFP', 'ESTP', 'ESFP']
+HOBBIES = [f"Hobby {i}" for i in range(100)]
+
+QUERIES = [
+    {},
+    {'college': 'College of Engineering'},
+    {'college': 'College of Science', 'gender': 'F'},
+    {'mbti': 'INTJ'},
+    {'gender': 'M', 'mbti': 'INTJ'},
+    {'major': 'Major 7', 'identity': 'Graduate'},
+    {'hometown': 'Town 42'},
+    {'age_min': 20, 'age_max': 22},
+    {'college': 'College of Business', 'age_min': 21},
+]
+
+
+def synthetic(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    tags = [(t, 'MBTI') for t in MBTI] + [(h, 'Hobby') for h in HOBBIES]
+    tag_rows = [array('I') for _ in tags]
+    rows = []
+    for i in range(n):
+        rows.append(SnapshotRow(
+            f"{58000000 + i:08d}", f"Student {i}", rng.choice([None, f"nick{i}"]), rng.choice(COLLEGES),
+            rng.randint(1, 6), rng.choice(MAJORS), rng.choice([None, 'Hello ' * rng.randint(1, 30)]),
+            rng.choice(IDENTITIES + (None,)), rng.choice('MFX'), rng.choice(HOMETOWNS + [None]),
+            rng.choice([None] + list(range(1995, 2007))),
+        ))
+        tag_rows[rng.randrange(len(MBTI))].append(i)
+        for tag in rng.sample(range(len(MBTI), len(tags)), 4):
+            tag_rows[tag].append(i)
+    return rows, tags, tag_rows
+
+
+def reference(rows, tags, tag_rows, filters, exclude, limit, offset):
+    this_year = date.today().year
+    mbti_rows = set()
+    if filters.get('mbti'):
+        mbti_rows = set(tag_rows[tags.index((filters['mbti'], 'MBTI'))])
+    matched = []
+    for i, r in enumerate(rows):
+        if r.student_id in exclude:
+            continue
+        if any(filters.get(f) and getattr(r, f) != filters[f]
+               for f in ('college', 'identity', 'gender', 'major', 'hometown')):
+            continue
+        if filters.get('mbti') and i not in mbti_rows:
+            continue
+        if (filters.get('age_min') or filters.get('age_max')) and r.birth_year is None:
+            continue
+        if filters.get('age_min') and this_year - r.birth_year < filters['age_min']:
+            continue
+        if filters.get('age_max') and this_year - r.birth_year > filters['age_max']:
+            continue
+        matched.append(r.student_id)
+    return matched[offset:offset + limit], len(matched)
+
+
+def main(n: int = 1_000_000):
+    start = time.perf_counter()
+    rows, tags, tag_rows = synthetic(n)
+    print(f"generated {n} students in {time.perf_counter() - start:.1f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        path = publish_snapshot(directory, time.time(), rows, tags, tag_rows)
+        print(f"wrote {os.path.getsize(path) / 1e6:.1f}MB in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        snapshot = Snapshot(path)
+        print(f"mapped in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        exclude = [rows[i].student_id for i in random.Random(2).sample(range(n), 200)]
+        for filters in QUERIES:
+            for offset in (0, 100):
+                start = time.perf_counter()
+                page, total = snapshot.search(filters, exclude, 5, offset)
+                ms = (time.perf_counter() - start) * 1000
+                expected = reference(rows, tags, tag_rows, filters, set(exclude), 5, offset)
+                assert ([c.student_id for c in page], total) == expected, filters
+                print(f"{ms:8.1f}ms  offset {offset:3}  total {total:7}  {filters}")
+        del snapshot
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
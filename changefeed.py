@@ -0,0 +1,123 @@
+# changefeed.py
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+from config import CHANGE_FEED_INTERVAL
+
+
+class ChangeFeed:
+    """Tails the ``change_log`` table and dispatches rows to local listeners.
+
+    Writers insert a change_log row in the same transaction as the data they
+    modify. Every process polls for ids above the last one it has seen (a single
+    primary-key range scan) and calls the callbacks registered for that entity,
+    which invalidate or patch in-process caches.
+
+    Auto-increment ids are handed out before commit, so a slow transaction can
+    become visible after a higher id has already been read. Missing ids are kept
+    as gaps and re-checked for ``gap_timeout`` seconds before being given up.
+    """
+
+    def __init__(self, interval: float = 1.0, batch_size: int = 1000,
+                 gap_timeout: float = 10.0, retention_days: int = 1):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.retention_days = retention_days
+        self.last_id = None
+        self._listeners: Dict[str, List[Callable]] = defaultdict(list)
+        self._gaps: Dict[int, float] = {}
+        self._connect = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_prune = 0.0
+
+    def subscribe(self, entity: str, callback: Callable[[str, Optional[str], str], None]) -> None:
+        """Call ``callback(entity_id, actor_id, op)`` for each change to ``entity``."""
+        self._listeners[entity].append(callback)
+
+    def start(self, connect: Callable) -> None:
+        if self._thread is not None:
+            return
+        self._connect = connect
+        self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def poll(self) -> int:
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                if self.last_id is None:
+                    cur.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+                    self.last_id = cur.fetchone()[0]
+                    return 0
+
+                rows = []
+                if self._gaps:
+                    gap_ids = list(self._gaps)
+                    placeholders = ', '.join(['%s'] * len(gap_ids))
+                    cur.execute(f"""
+                        SELECT id, entity, entity_id, actor_id, op FROM change_log
+                        WHERE id IN ({placeholders})
+                    """, gap_ids)
+                    rows.extend(cur.fetchall())
+
+                cur.execute("""
+                    SELECT id, entity, entity_id, actor_id, op FROM change_log
+                    WHERE id > %s ORDER BY id LIMIT %s
+                """, (self.last_id, self.batch_size))
+                rows.extend(cur.fetchall())
+
+                self._maybe_prune(cur)
+
+        now = time.monotonic()
+        for row in rows:
+            self._gaps.pop(row[0], None)
+            if row[0] > self.last_id:
+                # a jump wider than a batch is an id gap left by rollbacks or a restart
+                if row[0] - self.last_id <= self.batch_size:
+                    for missing in range(self.last_id + 1, row[0]):
+                        self._gaps[missing] = now
+                self.last_id = row[0]
+        for gap_id, seen in list(self._gaps.items()):
+            if now - seen > self.gap_timeout:
+                del self._gaps[gap_id]
+
+        for _, entity, entity_id, actor_id, op in rows:
+            for callback in self._listeners.get(entity, ()):
+                try:
+                    callback(entity_id, actor_id, op)
+                except Exception as e:
+                    print(f"[DAL ERROR] change feed listener for {entity} failed: {e}")
+        return len(rows)
+
+    def _maybe_prune(self, cur) -> None:
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        cur.execute("""
+            DELETE FROM change_log
+            WHERE created_at < NOW() - INTERVAL %s DAY
+            LIMIT 5000
+        """, (self.retention_days,))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[DAL ERROR] change feed poll failed: {e}")
+
+
+def log_change(cur, entity: str, entity_id: str, op: str = 'update', actor_id: str = None) -> None:
+    """Record a change; call inside the transaction that performs the write."""
+    cur.execute("""
+        INSERT INTO change_log (entity, entity_id, actor_id, op)
+        VALUES (%s, %s, %s, %s)
+    """, (entity, entity_id, actor_id, op))
+
+
+feed = ChangeFeed(interval=CHANGE_FEED_INTERVAL)
@@ -0,0 +1,288 @@
+# cohort_import.py
+"""Bulk import of student accounts from a CSV in the data/mock/student.csv shape.
+
+Used by the admin upload page (/admin/import) and by
+``python -m jobs.import_cohort``. The file is processed in chunks of
+IMPORT_CHUNK_SIZE rows, so memory stays flat however large it is:
+
+1. each row is validated as it is read (formats, enums, duplicates within the
+   file); one query per chunk finds ids and emails that already exist,
+2. the chunk's passwords are hashed on a thread pool (bcrypt releases the GIL,
+   so this uses every core),
+3. the chunk is written in one transaction with multi-row INSERTs into
+   ``user``, ``student`` and ``student_interest``. If that fails the chunk is
+   retried row by row, so one bad row only rejects itself.
+
+Besides the student.csv columns, a ``password`` column sets each initial
+password (otherwise the default password is used) and a ``tags`` column lists
+interest tag names separated by ``;``. Every rejected row is reported with its
+line number.
+
+Initial passwords are hashed with IMPORT_BCRYPT_ROUNDS, which is cheaper than
+BCRYPT_ROUNDS; authenticate_user rehashes them at full cost on first login.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, TextIO, Tuple
+
+import bcrypt
+
+import metrics
+from config import IMPORT_CHUNK_SIZE, IMPORT_BCRYPT_ROUNDS
+
+REQUIRED = ('student_id', 'name', 'gender', 'college', 'year_of_study', 'major', 'email')
+GENDERS = ('M', 'F', 'X')
+COLLEGES = (
+    'College of Business',
+    'College of Liberal Arts and Social Sciences',
+    'College of Science',
+    'College of Engineering',
+    'College of Veterinary Medicine and Life Sciences',
+    'Jockey Club College of Veterinary Medicine and Life Sciences',
+    'Cheng Yu Tung College',
+    'Run Run Shaw College',
+    'Other',
+)
+MARITAL_STATUSES = ('Single', 'Divorced-Single', 'Divorced-With-Child', 'Divorced-Without-Child', 'Widowed')
+IDENTITIES = ('Undergraduate', 'Graduate', 'PhD')
+
+STUDENT_COLUMNS = ('student_id', 'name', 'nickname', 'gender', 'college', 'year_of_study', 'major', 'email',
+                   'wechat_id', 'bio', 'avatar_url', 'is_verified', 'is_active', 'birth_date', 'height',
+                   'weight', 'hometown', 'marital_status', 'ideal_partner', 'identity', 'personal_photos')
+
+
+class RowError(NamedTuple):
+    line: int
+    student_id: str
+    message: str
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    errors: List[RowError]
+    seconds: float
+
+    def errors_csv(self) -> str:
+        lines = ['line,student_id,error']
+        for e in self.errors:
+            lines.append(','.join(_csv_field(v) for v in (str(e.line), e.student_id, e.message)))
+        return '\n'.join(lines) + '\n'
+
+
+def _csv_field(value: str) -> str:
+    if any(c in value for c in ',"\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+class _Row(NamedTuple):
+    line: int
+    student: tuple       # values in STUDENT_COLUMNS order
+    password: str
+    tag_ids: Tuple[int, ...]
+
+
+def _optional(raw: Dict, key: str) -> Optional[str]:
+    value = (raw.get(key) or '').strip()
+    return value or None
+
+
+def _validate(raw: Dict, line: int, tag_ids_by_name: Dict[str, int],
+              default_password: Optional[str]) -> _Row:
+    """Return the parsed row or raise ValueError with a message for the report."""
+    for key in REQUIRED:
+        if not (raw.get(key) or '').strip():
+            raise ValueError(f"{key} is required")
+
+    student_id = raw['student_id'].strip()
+    if not student_id.startswith('58') or len(student_id) != 8 or not student_id.isdigit():
+        raise ValueError("student_id must be 8 digits starting with 58")
+    gender = raw['gender'].strip()
+    if gender not in GENDERS:
+        raise ValueError(f"gender must be one of {', '.join(GENDERS)}")
+    college = raw['college'].strip()
+    if college not in COLLEGES:
+        raise ValueError(f"unknown college: {college}")
+    try:
+        year = int(raw['year_of_study'])
+    except ValueError:
+        raise ValueError("year_of_study must be a number")
+    if not 1 <= year <= 6:
+        raise ValueError("year_of_study must be between 1 and 6")
+    email = raw['email'].strip()
+    if '@' not in email or len(email) > 100:
+        raise ValueError("invalid email")
+
+    birth_date = _optional(raw, 'birth_date')
+    if birth_date:
+        try:
+            datetime.strptime(birth_date, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError("birth_date must be YYYY-MM-DD")
+    height, weight = _optional(raw, 'height'), _optional(raw, 'weight')
+    for key, value in (('height', height), ('weight', weight)):
+        if value is not None:
+            try:
+                float(value)
+            except ValueError:
+                raise ValueError(f"{key} must be a number")
+    marital_status = _optional(raw, 'marital_status')
+    if marital_status and marital_status not in MARITAL_STATUSES:
+        raise ValueError(f"unknown marital_status: {marital_status}")
+    identity = _optional(raw, 'identity')
+    if identity and identity not in IDENTITIES:
+        raise ValueError(f"unknown identity: {identity}")
+    photos = _optional(raw, 'personal_photos') or '[]'
+    try:
+        if not isinstance(json.loads(photos), list):
+            raise ValueError
+    except ValueError:
+        raise ValueError("personal_photos must be a JSON array")
+
+    password = raw.get('password') or default_password
+    if not password:
+        raise ValueError("no password column and no default password")
+    if len(password) < 6:
+        raise ValueError("password must be at least 6 characters")
+
+    tag_ids = []
+    for name in filter(None, (t.strip() for t in (raw.get('tags') or '').split(';'))):
+        if name not in tag_ids_by_name:
+            raise ValueError(f"unknown tag: {name}")
+        tag_ids.append(tag_ids_by_name[name])
+
+    student = (
+        student_id, raw['name'].strip(), _optional(raw, 'nickname'), gender, college, year,
+        raw['major'].strip(), email, _optional(raw, 'wechat_id'), _optional(raw, 'bio'),
+        _optional(raw, 'avatar_url'), _optional(raw, 'is_verified') == '1',
+        _optional(raw, 'is_active') != '0', birth_date, height, weight, _optional(raw, 'hometown'),
+        marital_status, _optional(raw, 'ideal_partner'), identity, photos,
+    )
+    return _Row(line, student, password, tuple(dict.fromkeys(tag_ids)))
+
+
+def _hash(password: str) -> str:
+    with metrics.time_bcrypt('import'):
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(IMPORT_BCRYPT_ROUNDS)).decode()
+
+
+def _insert(cur, rows: List[_Row], hashes: List[str]) -> None:
+    # pymysql folds executemany INSERT ... VALUES into multi-row statements, but
+    # only when the VALUES tuple holds nothing except placeholders
+    cur.executemany("""
+        INSERT INTO user (user_id, password_hash, role, is_active)
+        VALUES (%s, %s, %s, %s)
+    """, [(row.student[0], h, 'student', 1) for row, h in zip(rows, hashes)])
+    placeholders = ', '.join(['%s'] * len(STUDENT_COLUMNS))
+    cur.executemany(f"""
+        INSERT INTO student ({', '.join(STUDENT_COLUMNS)})
+        VALUES ({placeholders})
+    """, [row.student for row in rows])
+    interests = [(row.student[0], tag_id) for row in rows for tag_id in row.tag_ids]
+    if interests:
+        cur.executemany("""
+            INSERT INTO student_interest (student_id, tag_id)
+            VALUES (%s, %s)
+        """, interests)
+
+
+class CohortImporter:
+    def __init__(self, connect, tag_ids_by_name: Dict[str, int], default_password: Optional[str] = None,
+                 chunk_size: int = IMPORT_CHUNK_SIZE, workers: Optional[int] = None):
+        self.connect = connect
+        self.tag_ids_by_name = tag_ids_by_name
+        self.default_password = default_password
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.imported = 0
+        self.errors: List[RowError] = []
+
+    def run(self, stream: TextIO) -> ImportResult:
+        start = time.monotonic()
+        seen_ids, seen_emails = set(), set()
+        chunk: List[_Row] = []
+        with ThreadPoolExecutor(self.workers) as pool, self.connect() as conn:
+            # line 1 is the header
+            for line, raw in enumerate(csv.DictReader(stream), 2):
+                student_id = (raw.get('student_id') or '').strip()
+                try:
+                    row = _validate(raw, line, self.tag_ids_by_name, self.default_password)
+                except ValueError as e:
+                    self.errors.append(RowError(line, student_id, str(e)))
+                    continue
+                email = row.student[7].lower()
+                if student_id in seen_ids or email in seen_emails:
+                    self.errors.append(RowError(line, student_id, "duplicate student_id or email in file"))
+                    continue
+                seen_ids.add(student_id)
+                seen_emails.add(email)
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    self._write_chunk(conn, pool, chunk)
+                    chunk = []
+            if chunk:
+                self._write_chunk(conn, pool, chunk)
+        return ImportResult(self.imported, sorted(self.errors), round(time.monotonic() - start, 1))
+
+    def _write_chunk(self, conn, pool, chunk: List[_Row]) -> None:
+        chunk = self._drop_existing(conn, chunk)
+        if not chunk:
+            return
+        hashes = list(pool.map(_hash, (row.password for row in chunk)))
+        with conn.cursor() as cur:
+            try:
+                conn.begin()
+                _insert(cur, chunk, hashes)
+                conn.commit()
+                self.imported += len(chunk)
+                return
+            except Exception as e:
+                conn.rollback()
+                print(f"[IMPORT ERROR] chunk starting at line {chunk[0].line} failed, retrying row by row: {e}")
+            for row, h in zip(chunk, hashes):
+                try:
+                    conn.begin()
+                    _insert(cur, [row], [h])
+                    conn.commit()
+                    self.imported += 1
+                except Exception as e:
+                    conn.rollback()
+                    self.errors.append(RowError(row.line, row.student[0], f"database error: {e}"))
+
+    def _drop_existing(self, conn, chunk: List[_Row]) -> List[_Row]:
+        ids = [row.student[0] for row in chunk]
+        emails = [row.student[7] for row in chunk]
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT user_id FROM user WHERE user_id IN ({', '.join(['%s'] * len(ids))})", ids)
+            taken_ids = {r[0] for r in cur.fetchall()}
+            cur.execute(f"SELECT email FROM student WHERE email IN ({', '.join(['%s'] * len(emails))})", emails)
+            taken_emails = {r[0].lower() for r in cur.fetchall()}
+        kept = []
+        for row in chunk:
+            if row.student[0] in taken_ids:
+                self.errors.append(RowError(row.line, row.student[0], "student_id already exists"))
+            elif row.student[7].lower() in taken_emails:
+                self.errors.append(RowError(row.line, row.student[0], "email already exists"))
+            else:
+                kept.append(row)
+        return kept
+
+
+def import_cohort(stream: TextIO, default_password: Optional[str] = None,
+                  workers: Optional[int] = None) -> ImportResult:
+    """Import a cohort CSV and refresh the caches that list students."""
+    from dal import get_connection, get_active_tags, invalidate_search_facets
+    from changefeed import log_change
+
+    tag_ids = {tag['tag_name']: tag['tag_id'] for tag in get_active_tags()}
+    result = CohortImporter(get_connection, tag_ids, default_password, workers=workers).run(stream)
+    if result.imported:
+        invalidate_search_facets()
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                log_change(cur, 'student', 'import', op='insert')
+    return result
@@ -1,4 +1,9 @@
 # config.py
+import os
+
+# Private per-deployment state (caches, snapshots), next to the code like Flask's instance folder
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'root',
@@ -6,4 +11,125 @@ DB_CONFIG = {
     'database': 'cityu_match',
     'charset': 'utf8mb4',
     'autocommit': True
-}
\ No newline at end of file
+}
+
+# Seconds the faceted search aggregate is reused before it is rebuilt
+SEARCH_FACET_TTL = 60
+
+# Buffer like/unlike toggles in memory and write them in batches (single worker process only)
+LIKE_WRITE_BEHIND = False
+LIKE_FLUSH_INTERVAL = 0.5
+# Seconds between checks that this process still holds the write-behind lock
+LIKE_LOCK_CHECK_INTERVAL = 10
+
+# Seconds a student's pending-invitation badge count is cached
+PENDING_INVITATION_TTL = 30
+
+# Seconds the active interest tag list is cached
+TAG_CATALOG_TTL = 300
+
+# Seconds between polls of change_log for writes made by other worker processes
+CHANGE_FEED_INTERVAL = 1.0
+
+# Read replicas. Each entry overrides keys of DB_CONFIG, e.g. {'host': 'db-replica-1'}.
+# For local testing a second mysqld on another port works: {'host': '127.0.0.1', 'port': 3307}
+DB_REPLICAS = []
+# After a write, reads from the same session go to the primary for this many seconds
+REPLICA_STICKY_SECONDS = 5
+# Seconds a replica that failed to connect is left out of rotation
+REPLICA_RETRY_AFTER = 30
+
+# Return the search total with COUNT(*) OVER() in the page query (needs MySQL 8.0+)
+SEARCH_WINDOW_COUNT = True
+
+# Clients allowed to scrape /metrics; an empty tuple allows everyone
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# Compress text responses at least this many bytes long when the client accepts gzip/brotli
+COMPRESS_MIN_SIZE = 500
+# gzip level (brotli quality) for dynamic responses; static assets are precompressed at maximum
+COMPRESS_LEVEL = 6
+
+# Directory for compiled Jinja templates, shared by workers and kept across restarts; None disables it.
+# Created 0700; never point it at a directory other users can write to, such as /tmp itself
+TEMPLATE_BYTECODE_CACHE_DIR = os.path.join(INSTANCE_DIR, 'jinja-cache')
+# Compile all templates and load the tag catalog and search index at startup; /readyz waits for it
+WARMUP_ON_START = True
+
+# Offline batch matching job (python -m jobs.batch_matching)
+# Candidates kept per student, and the preference list length for the stable assignment
+MATCH_JOB_TOP_K = 10
+# Worker processes for pairwise scoring; None uses every CPU
+MATCH_JOB_WORKERS = None
+# Students scored per task handed to a worker
+MATCH_JOB_SHARD_SIZE = 2000
+# Students sampled per interest tag when generating candidates; common tags carry little weight
+MATCH_JOB_MAX_POSTING = 400
+# Score added per direction in which one student already liked the other
+MATCH_JOB_LIKE_BONUS = 0.25
+# Rows per INSERT batch when writing suggestions
+MATCH_JOB_BATCH_SIZE = 1000
+# Seconds the whole run may take; a run that overruns is abandoned and the previous run kept
+MATCH_JOB_TIME_BUDGET = 900
+# Completed runs kept in match_suggestion (see match_run)
+MATCH_JOB_KEEP_RUNS = 2
+
+# Open /matching/events streams allowed per worker process; more get 503 and retry later
+SSE_MAX_CONNECTIONS = 5000
+# Seconds between keep-alive comments on an idle event stream
+SSE_HEARTBEAT_SECONDS = 25
+
+# Seconds a student's set of already liked/invited/reported students is cached for search
+SEARCH_EXCLUSION_TTL = 600
+
+# Archival of cold rows (python -m jobs.archive_cold_rows)
+# Days a row must have been unliked / rejected / cancelled / resolved before it is archived
+ARCHIVE_AFTER_DAYS = 30
+# Rows moved per transaction; small batches keep row locks short
+ARCHIVE_BATCH_SIZE = 500
+# Seconds to pause between batches so replication and live traffic keep up
+ARCHIVE_BATCH_PAUSE = 0.2
+
+# bcrypt cost for passwords set by users; hashes below it are upgraded at login
+BCRYPT_ROUNDS = 12
+# Cohort import (admin upload or python -m jobs.import_cohort)
+# Rows validated, hashed and inserted per transaction
+IMPORT_CHUNK_SIZE = 1000
+# bcrypt cost for imported initial passwords, upgraded to BCRYPT_ROUNDS on first login
+IMPORT_BCRYPT_ROUNDS = 10
+# Largest file the admin upload accepts, in data rows; bigger cohorts go through the job,
+# since the upload is imported within the request
+IMPORT_WEB_MAX_ROWS = 1000
+
+# Reverse proxies in front of the app that append to X-Forwarded-For; 0 trusts none.
+# Behind a proxy set this, or rate limits and METRICS_ALLOWED_IPS see only the proxy's address
+TRUSTED_PROXY_HOPS = 0
+
+# Rate limits: per limit, (burst size, seconds to refill it) for each bucket key;
+# 'user' is the session user (the submitted student_id for login), 'ip' the client address
+RATE_LIMITS = {
+    'like': {'user': (30, 60), 'ip': (120, 60)},
+    'invite': {'user': (10, 60), 'ip': (60, 60)},
+    'report': {'user': (5, 300), 'ip': (20, 300)},
+    'login': {'user': (5, 300), 'ip': (20, 60)},
+}
+# 'memory' keeps buckets per worker process; a redis:// URL shares them between workers
+RATE_LIMIT_STORAGE = 'memory'
+# Buckets kept in memory before idle ones are dropped
+RATE_LIMIT_MAX_KEYS = 100000
+
+# Memory-mapped profile snapshot served by search (python -m jobs.build_profile_snapshot); None disables it.
+# Created 0700, so the builder must run as the same user as the web workers
+PROFILE_SNAPSHOT_DIR = os.path.join(INSTANCE_DIR, 'profile-snapshots')
+# Seconds between checks of the directory for a newer snapshot version
+PROFILE_SNAPSHOT_CHECK_INTERVAL = 5
+# Snapshots older than this many seconds are ignored and search goes to MySQL
+PROFILE_SNAPSHOT_MAX_AGE = 3600
+# Snapshot versions kept on disk
+PROFILE_SNAPSHOT_KEEP = 3
+
+# Shared control file and per-worker samples of the admin request profiler; created 0700
+PROFILER_DIR = os.path.join(INSTANCE_DIR, 'profiler')
+
+# Rows updated per transaction by the bulk user and tag actions in the admin pages
+ADMIN_BULK_CHUNK_SIZE = 1000
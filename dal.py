@@ -1,21 +1,85 @@
 # dal.py
 import pymysql
 import bcrypt
-from config import DB_CONFIG
+from collections import Counter
+from datetime import date
+from cache import TTLCache
+from changefeed import feed, log_change
+from write_behind import WriteBehindQueue
+from search_query import (compile_search, search_params, search_signature, ExclusionSet, exclusion_slots,
+                          exclusion_params)
+from archive import union_with_archive
+from profile_snapshot import SnapshotStore
+from rows import (StudentCard, STUDENT_CARD_COLUMNS, SentInvitationRow, ReceivedInvitationRow,
+                  ReportQueueRow)
+import itertools
+import metrics
+import os
+import threading
+import time
+from flask import has_request_context, session
+from config import (DB_CONFIG, DB_REPLICAS, REPLICA_STICKY_SECONDS, REPLICA_RETRY_AFTER,
+                    SEARCH_FACET_TTL, SEARCH_WINDOW_COUNT, LIKE_WRITE_BEHIND, LIKE_FLUSH_INTERVAL, LIKE_LOCK_CHECK_INTERVAL,
+                    PENDING_INVITATION_TTL, TAG_CATALOG_TTL, SEARCH_EXCLUSION_TTL, BCRYPT_ROUNDS,
+                    PROFILE_SNAPSHOT_DIR, PROFILE_SNAPSHOT_CHECK_INTERVAL, PROFILE_SNAPSHOT_MAX_AGE,
+                    ADMIN_BULK_CHUNK_SIZE)
 from typing import List, Dict, Optional, Tuple
 
+class _Connection(pymysql.connections.Connection):
+    """PyMySQL connection that counts every statement for /metrics."""
+    
+    def query(self, sql, unbuffered=False):
+        metrics.record_db_query()
+        return super().query(sql, unbuffered)
+
 def get_connection():
-    return pymysql.connect(**DB_CONFIG)
+    """Connection to the primary; use for writes and reads that must be current."""
+    metrics.record_db_connection('primary')
+    return _Connection(**DB_CONFIG)
 
-def get_like_status(from_id: str, to_id: str) -> str:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT status FROM likes 
-                WHERE from_student_id = %s AND to_student_id = %s
-            """, (from_id, to_id))
-            result = cur.fetchone()
-            return result[0] if result else 'unliked'
+_replica_configs = [{**DB_CONFIG, **replica} for replica in DB_REPLICAS]
+_replica_down_until = [0.0] * len(_replica_configs)
+_replica_turn = itertools.count()
+
+def get_read_connection():
+    """Connection for read-only queries, balanced round-robin across DB_REPLICAS.
+
+    Falls back to the primary when no replica is configured or reachable, and for
+    REPLICA_STICKY_SECONDS after the current session wrote, so users always see
+    their own changes despite replication lag. A replica that refuses a
+    connection is skipped for REPLICA_RETRY_AFTER seconds.
+    """
+    if not _replica_configs or _recently_wrote():
+        return get_connection()
+    
+    start = next(_replica_turn)
+    for i in range(len(_replica_configs)):
+        idx = (start + i) % len(_replica_configs)
+        if _replica_down_until[idx] > time.monotonic():
+            continue
+        try:
+            metrics.record_db_connection('replica')
+            return _Connection(**_replica_configs[idx])
+        except pymysql.err.OperationalError as e:
+            print(f"[DAL ERROR] replica {_replica_configs[idx]['host']} unavailable: {e}")
+            _replica_down_until[idx] = time.monotonic() + REPLICA_RETRY_AFTER
+    return get_connection()
+
+def mark_write() -> None:
+    """Pin the current session's reads to the primary for a short while."""
+    if has_request_context():
+        session['_wrote_at'] = time.time()
+
+def _recently_wrote() -> bool:
+    return has_request_context() and time.time() - session.get('_wrote_at', 0) < REPLICA_STICKY_SECONDS
+
+_pending_invitation_cache = TTLCache('pending_invitations', ttl=PENDING_INVITATION_TTL)
+# students whose count changed within the replica lag window; their next load reads the primary
+_pending_invitation_changed = TTLCache('pending_invitations_changed', ttl=REPLICA_STICKY_SECONDS)
+
+def _invalidate_pending_invitations(student_id: str) -> None:
+    _pending_invitation_changed.set(student_id, True)
+    _pending_invitation_cache.invalidate(student_id)
 
 def authenticate_user(user_id: str, password: str) -> Optional[Dict]:
     with get_connection() as conn:
@@ -34,10 +98,15 @@ def authenticate_user(user_id: str, password: str) -> Optional[Dict]:
             
             if stored_password.startswith('$2b$'):
                 try:
-                    if not bcrypt.checkpw(password.encode('utf-8'), stored_password.encode('utf-8')):
+                    with metrics.time_bcrypt('check'):
+                        matched = bcrypt.checkpw(password.encode('utf-8'), stored_password.encode('utf-8'))
+                    if not matched:
                         return None
                 except Exception:
                     return None
+                # cheaper hashes (e.g. from a cohort import) are upgraded once the password is known
+                if int(stored_password[4:6]) < BCRYPT_ROUNDS:
+                    _upgrade_password_hash(cur, user['user_id'], password)
             else:
                 if stored_password != password:
                     return None
@@ -47,9 +116,17 @@ def authenticate_user(user_id: str, password: str) -> Optional[Dict]:
                 'role': user['role']
             }
 
+def _upgrade_password_hash(cur, user_id: str, password: str) -> None:
+    try:
+        with metrics.time_bcrypt('hash'):
+            hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS))
+        cur.execute("UPDATE user SET password_hash = %s WHERE user_id = %s", (hashed.decode(), user_id))
+    except Exception as e:
+        print(f"[DAL ERROR] password hash upgrade failed: {e}")
+
 def get_student(student_id: str) -> Optional[Dict]:
     """获取学生基本信息（含新字段）"""
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute("""
                 SELECT s.*
@@ -67,7 +144,7 @@ def get_student(student_id: str) -> Optional[Dict]:
             
             return result
 def get_student_interests(student_id: str) -> List[Dict]:
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute("""
                 SELECT it.tag_id, it.tag_name, it.category
@@ -80,7 +157,7 @@ def get_student_interests(student_id: str) -> List[Dict]:
 
 
 def get_mutual_matches(student_id: str) -> List[Dict]:
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute("""
                 SELECT 
@@ -103,6 +180,7 @@ def send_invitation(from_id: str, to_id: str) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
+                conn.begin()
                 cur.execute("""
                     INSERT INTO invitations (from_student_id, to_student_id)
                     VALUES (%s, %s)
@@ -110,27 +188,57 @@ def send_invitation(from_id: str, to_id: str) -> bool:
                         status = 'pending',
                         updated_at = NOW()
                 """, (from_id, to_id))
+                log_change(cur, 'invitation', to_id, op='sent', actor_id=from_id)
+                conn.commit()
+                _invalidate_pending_invitations(to_id)
+                _note_handled(from_id, to_id)
                 return True
             except Exception as e:
+                conn.rollback()
                 print(f"[DAL ERROR] send_invitation failed: {e}")
                 return False
 
-def respond_to_invitation(invitation_id: int, response: str) -> bool:
+def respond_to_invitation(invitation_id: int, response: str, to_id: str = None) -> bool:
+    """Accept or reject a pending invitation in one conditional UPDATE.
+
+    When ``to_id`` is given the invitation must also be addressed to that student,
+    so ownership, state and the write are checked in a single round trip. On
+    success a change_log row lets the inviter's event stream pick it up.
+    """
     if response not in ['accepted', 'rejected']:
         return False
     
+    sql = """
+        UPDATE invitations
+        SET status = %s, updated_at = NOW()
+        WHERE id = %s AND status = 'pending'
+    """
+    params = [response, invitation_id]
+    if to_id is not None:
+        sql += " AND to_student_id = %s"
+        params.append(to_id)
+    
+    mark_write()
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
-                cur.execute("""
-                    UPDATE invitations
-                    SET status = %s, updated_at = NOW()
-                    WHERE id = %s AND status = 'pending'
-                """, (response, invitation_id))
-                return cur.rowcount > 0
+                conn.begin()
+                cur.execute(sql, params)
+                if cur.rowcount == 0:
+                    conn.rollback()
+                    return False
+                cur.execute("SELECT from_student_id, to_student_id FROM invitations WHERE id = %s",
+                            (invitation_id,))
+                from_id, invitee_id = cur.fetchone()
+                # logged against the inviter, who is the one to notify
+                log_change(cur, 'invitation', from_id, op=response, actor_id=invitee_id)
+                conn.commit()
             except Exception as e:
+                conn.rollback()
                 print(f"[DAL ERROR] respond_to_invitation failed: {e}")
                 return False
+    _invalidate_pending_invitations(invitee_id)
+    return True
 
 def send_report(reporter_id: str, reported_id: str, reason: str, description: str = None) -> bool:
     if reporter_id == reported_id:
@@ -139,21 +247,48 @@ def send_report(reporter_id: str, reported_id: str, reason: str, description: st
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
+                conn.begin()
+                cur.execute("""
+                    SELECT 1 FROM reports
+                    WHERE reporter_id = %s AND reported_id = %s AND status = 'pending'
+                    LIMIT 1
+                """, (reporter_id, reported_id))
+                new_reporter = 0 if cur.fetchone() else 1
+                
                 cur.execute("""
                     INSERT INTO reports (reporter_id, reported_id, reason, description)
                     VALUES (%s, %s, %s, %s)
                 """, (reporter_id, reported_id, reason, description))
+                
+                # assignments run left to right, so priority sees the new counts
+                cur.execute(f"""
+                    INSERT INTO report_queue
+                        (reported_id, report_count, reporter_count, first_reported_at, last_reported_at, priority)
+                    VALUES (%s, 1, 1, NOW(), NOW(), {_REPORT_PRIORITY_SQL.format(reporters='1', reports='1', last='NOW()')})
+                    ON DUPLICATE KEY UPDATE
+                        reporter_count = reporter_count + %s,
+                        report_count = report_count + 1,
+                        last_reported_at = NOW(),
+                        priority = {_REPORT_PRIORITY_SQL.format(reporters='reporter_count', reports='report_count', last='last_reported_at')}
+                """, (reported_id, new_reporter))
+                log_change(cur, 'report', reported_id, op='insert', actor_id=reporter_id)
+                conn.commit()
+                _note_handled(reporter_id, reported_id)
                 return True
             except Exception as e:
+                conn.rollback()
                 print(f"[DAL ERROR] send_report failed: {e}")
                 return False
 
-def get_invitations(student_id: str, status: str = None) -> List[Dict]:
-    with get_connection() as conn:
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+def get_invitations(student_id: str, status: str = None,
+                    before: Tuple = None, limit: int = None) -> List[SentInvitationRow]:
+    """Invitations sent by ``student_id``, newest first, including archived ones."""
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
             sql = """
-                SELECT i.*, s.name as to_name, s.nickname as to_nickname, s.wechat_id as to_wechat_id
-                FROM invitations i
+                SELECT i.id, i.status, i.created_at,
+                       s.name as to_name, s.nickname as to_nickname, s.wechat_id as to_wechat_id
+                FROM {table} i
                 JOIN student s ON i.to_student_id = s.student_id
                 WHERE i.from_student_id = %s
             """
@@ -162,18 +297,24 @@ def get_invitations(student_id: str, status: str = None) -> List[Dict]:
             if status:
                 sql += " AND i.status = %s"
                 params.append(status)
+            if before:
+                sql += " AND (i.created_at < %s OR (i.created_at = %s AND i.id < %s))"
+                params.extend([before[0], before[0], before[1]])
             
-            sql += " ORDER BY i.created_at DESC"
-            
+            sql, params = union_with_archive('invitations', sql, params, "created_at DESC, id DESC",
+                                             limit=limit, status=status)
             cur.execute(sql, params)
-            return cur.fetchall()
+            return [SentInvitationRow._make(row) for row in cur.fetchall()]
 
-def get_received_invitations(student_id: str, status: str = None) -> List[Dict]:
-    with get_connection() as conn:
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+def get_received_invitations(student_id: str, status: str = None,
+                             before: Tuple = None, limit: int = None) -> List[ReceivedInvitationRow]:
+    """Invitations received by ``student_id``, newest first, including archived ones."""
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
             sql = """
-                SELECT i.*, s.name as from_name, s.nickname as from_nickname, s.wechat_id
-                FROM invitations i
+                SELECT i.id, i.status, i.created_at,
+                       s.name as from_name, s.nickname as from_nickname, s.wechat_id
+                FROM {table} i
                 JOIN student s ON i.from_student_id = s.student_id
                 WHERE i.to_student_id = %s
             """
@@ -182,22 +323,56 @@ def get_received_invitations(student_id: str, status: str = None) -> List[Dict]:
             if status:
                 sql += " AND i.status = %s"
                 params.append(status)
+            if before:
+                sql += " AND (i.created_at < %s OR (i.created_at = %s AND i.id < %s))"
+                params.extend([before[0], before[0], before[1]])
             
-            sql += " ORDER BY i.created_at DESC"
-            
+            sql, params = union_with_archive('invitations', sql, params, "created_at DESC, id DESC",
+                                             limit=limit, status=status)
             cur.execute(sql, params)
-            return cur.fetchall()
+            return [ReceivedInvitationRow._make(row) for row in cur.fetchall()]
+
+def count_pending_invitations(student_id: str) -> int:
+    """Number of received invitations still waiting for an answer (cached briefly).
+
+    Right after a change the count is reloaded from the primary, so a lagging
+    replica cannot put the old value back in the cache for the whole TTL.
+    """
+    def load():
+        changed = _pending_invitation_changed.get(student_id)
+        with (get_connection() if changed else get_read_connection()) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT COUNT(*) FROM invitations
+                    WHERE to_student_id = %s AND status = 'pending'
+                """, (student_id,))
+                return cur.fetchone()[0]
+    return _pending_invitation_cache.get_or_load(student_id, load)
 
 def toggle_like(from_id: str, to_id: str) -> bool:
     if from_id == to_id:
         return False
     
+    if _like_queue is not None and _holds_like_lock():
+        current = _like_queue.get((from_id, to_id))
+        if current is None:
+            # a missing target would fail the foreign key only at flush time
+            current = _like_target_status(from_id, to_id)
+            if current is None:
+                return False
+        new_status = 'unliked' if current == 'liked' else 'liked'
+        _like_queue.put((from_id, to_id), new_status, base=current)
+        _on_like_change(to_id, from_id, new_status)
+        return True
+    
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
+                conn.begin()
                 cur.execute("""
                     SELECT status FROM likes 
                     WHERE from_student_id = %s AND to_student_id = %s
+                    FOR UPDATE
                 """, (from_id, to_id))
                 existing = cur.fetchone()
                 
@@ -213,13 +388,25 @@ def toggle_like(from_id: str, to_id: str) -> bool:
                         INSERT INTO likes (from_student_id, to_student_id, status)
                         VALUES (%s, %s, 'liked')
                     """, (from_id, to_id))
+                    new_status = 'liked'
                 
+                log_change(cur, 'like', to_id, op=new_status, actor_id=from_id)
+                conn.commit()
+                _on_like_change(to_id, from_id, new_status)
                 return True
             except Exception as e:
+                conn.rollback()
                 print(f"[DAL ERROR] toggle_like failed: {e}")
                 return False
 
 def get_like_status(from_id: str, to_id: str) -> str:
+    if _like_queue is not None:
+        pending = _like_queue.get((from_id, to_id))
+        if pending is not None:
+            return pending
+    return _get_like_status_db(from_id, to_id)
+
+def _get_like_status_db(from_id: str, to_id: str) -> str:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
@@ -229,8 +416,22 @@ def get_like_status(from_id: str, to_id: str) -> str:
             result = cur.fetchone()
             return result[0] if result else 'unliked'
 
-def get_like_count(student_id: str) -> int:
+def _like_target_status(from_id: str, to_id: str) -> Optional[str]:
+    """Like status towards ``to_id``, or None if there is no such active student."""
     with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT l.status FROM student s
+                LEFT JOIN likes l ON l.to_student_id = s.student_id AND l.from_student_id = %s
+                WHERE s.student_id = %s AND s.is_active = 1
+            """, (from_id, to_id))
+            result = cur.fetchone()
+            if result is None:
+                return None
+            return result[0] or 'unliked'
+
+def get_like_count(student_id: str) -> int:
+    with get_read_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT COUNT(*) as count 
@@ -238,10 +439,16 @@ def get_like_count(student_id: str) -> int:
                 WHERE to_student_id = %s AND status = 'liked'
             """, (student_id,))
             result = cur.fetchone()
-            return result[0] if result else 0
+            count = result[0] if result else 0
+    
+    if _like_queue is not None:
+        for (_, to_id), status, base in _like_queue.entries():
+            if to_id == student_id:
+                count += (status == 'liked') - (base == 'liked')
+    return count
 
 def get_user_likes(student_id: str) -> List[Dict]:
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute("""
                 SELECT l.*, s.name as to_name, s.nickname as to_nickname
@@ -251,3 +458,714 @@ def get_user_likes(student_id: str) -> List[Dict]:
                 ORDER BY l.created_at DESC
             """, (student_id,))
             return cur.fetchall()
+
+
+# Write-behind likes
+# ------------------
+# With LIKE_WRITE_BEHIND enabled, toggle_like only records the new status in an
+# in-process buffer. The buffer is flushed as one multi-row upsert every
+# LIKE_FLUSH_INTERVAL seconds and on interpreter shutdown; get_like_status and
+# get_like_count overlay buffered toggles so the acting user sees their own likes.
+#
+# The buffer is per process, so two workers toggling the same pair would each
+# flush their own idea of the status. Only the process holding a MySQL named
+# lock buffers; it is taken lazily from the worker itself (never before a fork)
+# and rechecked by the flush thread and before every flush, since the server
+# releases it silently when the connection drops. Other processes, and a
+# process that lost the lock, write each toggle directly. Deploy one worker:
+# with several, a direct write can still race a toggle buffered elsewhere
+# within one flush interval.
+
+def _write_likes(conn, cur, batch: List[Tuple[Tuple[str, str], str]]) -> None:
+    try:
+        conn.begin()
+        cur.executemany("""
+            INSERT INTO likes (from_student_id, to_student_id, status)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE status = VALUES(status), updated_at = NOW()
+        """, [(from_id, to_id, status) for (from_id, to_id), status in batch])
+        cur.executemany("""
+            INSERT INTO change_log (entity, entity_id, actor_id, op)
+            VALUES ('like', %s, %s, %s)
+        """, [(to_id, from_id, status) for (from_id, to_id), status in batch])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _flush_likes(batch: List[Tuple[Tuple[str, str], str]]) -> None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                _write_likes(conn, cur, batch)
+                return
+            except pymysql.err.IntegrityError as e:
+                # e.g. a student deleted since the toggle; retrying the batch would fail
+                # forever, so write row by row and drop only the rows that cannot be stored
+                print(f"[DAL ERROR] like flush rejected, retrying {len(batch)} rows one by one: {e}")
+            for entry in batch:
+                try:
+                    _write_likes(conn, cur, [entry])
+                except pymysql.err.IntegrityError as e:
+                    print(f"[DAL ERROR] dropping like {entry}: {e}")
+
+_LIKE_LOCK = 'campus_match.like_write_behind'
+_like_lock_mutex = threading.Lock()
+_like_lock_conn = None
+_like_lock_pid = None
+_like_lock_held = False
+_like_lock_checked = 0.0
+
+
+def _holds_like_lock(force: bool = False) -> bool:
+    """Whether this process holds the write-behind lock, taking it if it is free.
+
+    The answer is rechecked against MySQL every LIKE_LOCK_CHECK_INTERVAL seconds
+    (always when ``force``), which also keeps the idle lock connection alive.
+    """
+    global _like_lock_conn, _like_lock_pid, _like_lock_held, _like_lock_checked
+    now = time.monotonic()
+    if not force and _like_lock_pid == os.getpid() and now - _like_lock_checked < LIKE_LOCK_CHECK_INTERVAL:
+        return _like_lock_held
+    with _like_lock_mutex:
+        if _like_lock_pid != os.getpid():
+            # a connection inherited across fork is the parent's; never use or close it
+            _like_lock_conn = None
+            _like_lock_held = False
+            _like_lock_pid = os.getpid()
+        was_held = _like_lock_held
+        _like_lock_held = False
+        try:
+            if _like_lock_conn is None:
+                _like_lock_conn = get_connection()
+            with _like_lock_conn.cursor() as cur:
+                # the server drops the lock silently with the connection (wait_timeout,
+                # network errors), so ask who holds it rather than trusting GET_LOCK's old answer
+                cur.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (_LIKE_LOCK,))
+                held = cur.fetchone()[0] == 1
+                if not held:
+                    cur.execute("SELECT GET_LOCK(%s, 0)", (_LIKE_LOCK,))
+                    held = cur.fetchone()[0] == 1
+            _like_lock_held = held
+        except Exception as e:
+            print(f"[DAL ERROR] like write-behind lock check failed: {e}")
+            try:
+                _like_lock_conn.close()
+            except Exception:
+                pass
+            _like_lock_conn = None
+        _like_lock_checked = now
+        if was_held and not _like_lock_held:
+            print("[DAL ERROR] lost the like write-behind lock; writing likes directly")
+        return _like_lock_held
+
+
+def _flush_buffered_likes(batch: List[Tuple[Tuple[str, str], str]]) -> None:
+    # Buffered toggles are still written if the lock was lost: they are the
+    # user's own clicks. New toggles stop being buffered from here on.
+    _holds_like_lock(force=True)
+    _flush_likes(batch)
+
+_like_queue = (WriteBehindQueue(_flush_buffered_likes, LIKE_FLUSH_INTERVAL, heartbeat=_holds_like_lock)
+               if LIKE_WRITE_BEHIND else None)
+
+
+# Moderation queue
+# ----------------
+# report_queue keeps one row per reported user with pending reports. Priority
+# adds a recency term of one point per day since the epoch, which orders rows
+# exactly like a linear age decay would, but stays constant once written and so
+# can be indexed.
+
+_REPORT_PRIORITY_SQL = "{reporters} * 5 + {reports} + UNIX_TIMESTAMP({last}) / 86400"
+
+
+def _rebuild_report_queue(cur, reported_ids: List[str]) -> None:
+    """Recompute queue rows for ``reported_ids`` from their pending reports."""
+    placeholders = ', '.join(['%s'] * len(reported_ids))
+    cur.execute(f"DELETE FROM report_queue WHERE reported_id IN ({placeholders})", reported_ids)
+    cur.execute(f"""
+        INSERT INTO report_queue
+            (reported_id, report_count, reporter_count, first_reported_at, last_reported_at, priority)
+        SELECT reported_id, COUNT(*), COUNT(DISTINCT reporter_id), MIN(created_at), MAX(created_at),
+               {_REPORT_PRIORITY_SQL.format(reporters='COUNT(DISTINCT reporter_id)', reports='COUNT(*)', last='MAX(created_at)')}
+        FROM reports
+        WHERE reported_id IN ({placeholders}) AND status = 'pending'
+        GROUP BY reported_id
+    """, reported_ids)
+
+
+def get_report_queue(before: Tuple = None, limit: int = 20) -> List[ReportQueueRow]:
+    """Reported users ordered by priority, paged with a (priority, reported_id) cursor."""
+    sql = """
+        SELECT q.reported_id, q.report_count, q.reporter_count,
+               q.first_reported_at, q.last_reported_at, q.priority,
+               s.name AS reported_name, s.nickname AS reported_nickname
+        FROM report_queue q
+        LEFT JOIN student s ON s.student_id = q.reported_id
+    """
+    params = []
+    if before:
+        sql += " WHERE (q.priority < %s OR (q.priority = %s AND q.reported_id < %s))"
+        params.extend([before[0], before[0], before[1]])
+    sql += " ORDER BY q.priority DESC, q.reported_id DESC LIMIT %s"
+    params.append(limit)
+    
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return [ReportQueueRow._make(row) for row in cur.fetchall()]
+
+
+def resolve_reports_for(reported_ids: List[str]) -> int:
+    """Resolve every pending report against the given users; returns reports updated."""
+    if not reported_ids:
+        return 0
+    placeholders = ', '.join(['%s'] * len(reported_ids))
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                conn.begin()
+                cur.execute(f"""
+                    UPDATE reports
+                    SET status = 'resolved', resolved_at = NOW()
+                    WHERE reported_id IN ({placeholders}) AND status = 'pending'
+                """, reported_ids)
+                affected = cur.rowcount
+                cur.execute(f"DELETE FROM report_queue WHERE reported_id IN ({placeholders})", reported_ids)
+                conn.commit()
+                return affected
+            except Exception as e:
+                conn.rollback()
+                print(f"[DAL ERROR] resolve_reports_for failed: {e}")
+                return 0
+
+
+def delete_reports_for(reported_ids: List[str]) -> int:
+    """Delete every pending report against the given users; returns reports deleted."""
+    if not reported_ids:
+        return 0
+    placeholders = ', '.join(['%s'] * len(reported_ids))
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                conn.begin()
+                cur.execute(f"""
+                    DELETE FROM reports
+                    WHERE reported_id IN ({placeholders}) AND status = 'pending'
+                """, reported_ids)
+                affected = cur.rowcount
+                cur.execute(f"DELETE FROM report_queue WHERE reported_id IN ({placeholders})", reported_ids)
+                conn.commit()
+                return affected
+            except Exception as e:
+                conn.rollback()
+                print(f"[DAL ERROR] delete_reports_for failed: {e}")
+                return 0
+
+
+def update_report(report_id: int, action: str) -> bool:
+    """Resolve or delete a single report and refresh its queue row."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                conn.begin()
+                cur.execute("SELECT reported_id FROM reports WHERE id = %s FOR UPDATE", (report_id,))
+                row = cur.fetchone()
+                if not row:
+                    conn.rollback()
+                    return False
+                if action == 'resolve':
+                    cur.execute("""
+                        UPDATE reports 
+                        SET status = 'resolved', resolved_at = NOW()
+                        WHERE id = %s
+                    """, (report_id,))
+                else:
+                    cur.execute("DELETE FROM reports WHERE id = %s", (report_id,))
+                _rebuild_report_queue(cur, [row[0]])
+                conn.commit()
+                return True
+            except Exception as e:
+                conn.rollback()
+                print(f"[DAL ERROR] update_report failed: {e}")
+                return False
+
+
+# Search
+# ------
+
+_snapshots = (SnapshotStore(PROFILE_SNAPSHOT_DIR, get_connection, PROFILE_SNAPSHOT_CHECK_INTERVAL,
+                            PROFILE_SNAPSHOT_MAX_AGE) if PROFILE_SNAPSHOT_DIR else None)
+
+
+def warm_profile_snapshot() -> None:
+    """Map the current profile snapshot now rather than on the first search."""
+    if _snapshots is not None:
+        _snapshots.current()
+
+
+def search_students(filters: Dict, exclude_id: str, limit: int, offset: int,
+                    hidden: ExclusionSet = None) -> Tuple[List[StudentCard], int]:
+    """One page of active students matching ``filters`` plus the total match count.
+
+    Students in ``hidden`` are left out of both the page and the total. Served
+    from the profile snapshot when a current one is loaded.
+    """
+    if _snapshots is not None:
+        found = _snapshots.search(filters, exclude_id, hidden, limit, offset)
+        if found is not None:
+            return found
+
+    signature = search_signature(filters)
+    slots = exclusion_slots(len(hidden)) if hidden else 0
+    compiled = compile_search(signature, columns=STUDENT_CARD_COLUMNS, window_count=SEARCH_WINDOW_COUNT,
+                              exclude_slots=slots)
+    params = search_params(signature, filters, exclude_id)
+    if slots:
+        params += exclusion_params(hidden, exclude_id)
+    
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(compiled.page_sql, params + [limit, offset])
+            rows = cur.fetchall()
+            if SEARCH_WINDOW_COUNT:
+                # total_count is the trailing column
+                students = [StudentCard._make(row[:-1]) for row in rows]
+                if rows:
+                    return students, rows[0][-1]
+                if offset == 0:
+                    return students, 0
+            else:
+                students = [StudentCard._make(row) for row in rows]
+            
+            # past the last page, or no window functions: count separately
+            cur.execute(compiled.count_sql, params)
+            return students, cur.fetchone()[0]
+
+
+# Faceted search counts
+# ---------------------
+# The whole active population is aggregated once into distinct attribute
+# combinations; per-request facet counts are then derived in Python instead of
+# running one GROUP BY per facet. A single student's edit moves their one
+# combination in place instead of reloading the index.
+
+FACET_FIELDS = ('college', 'identity', 'gender', 'major', 'hometown', 'mbti')
+_KEY_INDEX = {'college': 0, 'identity': 1, 'gender': 2, 'major': 3, 'hometown': 4}
+
+_facet_index_cache = TTLCache('search_facet_index', ttl=SEARCH_FACET_TTL, maxsize=1)
+_facet_cache = TTLCache('search_facets', ttl=SEARCH_FACET_TTL, maxsize=512)
+_facet_patch_lock = threading.Lock()
+
+_FACET_INDEX_SQL = """
+    SELECT s.student_id, s.college, s.identity, s.gender, s.major, s.hometown,
+           YEAR(s.birth_date), GROUP_CONCAT(it.tag_name)
+    FROM student s
+    LEFT JOIN student_interest si ON si.student_id = s.student_id
+    LEFT JOIN interest_tag it ON it.tag_id = si.tag_id AND it.category = 'MBTI'
+    WHERE s.is_active = 1{where}
+    GROUP BY s.student_id
+"""
+
+
+class FacetIndex:
+    """Active students grouped by attribute combination, and each student's combination."""
+
+    def __init__(self, combos: Counter, owners: Dict[str, tuple]):
+        self.combos = combos
+        self.owners = owners
+
+
+def _facet_key(row) -> tuple:
+    mbti = tuple(sorted(row[7].split(','))) if row[7] else ()
+    return (row[1], row[2], row[3], row[4], row[5], row[6], mbti)
+
+
+def _load_facet_index() -> FacetIndex:
+    combos = Counter()
+    owners = {}
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_FACET_INDEX_SQL.format(where=''))
+            for row in cur.fetchall():
+                key = _facet_key(row)
+                combos[key] += 1
+                owners[row[0]] = key
+    return FacetIndex(combos, owners)
+
+
+def _add_facet_contribution(facets: Dict[str, Counter], key: tuple, n: int,
+                            filters: Dict, this_year: int) -> None:
+    birth_year = key[5]
+    if filters.get('age_min') and (birth_year is None or this_year - birth_year < filters['age_min']):
+        return
+    if filters.get('age_max') and (birth_year is None or this_year - birth_year > filters['age_max']):
+        return
+
+    missed = None
+    for field, idx in _KEY_INDEX.items():
+        value = filters.get(field)
+        if value and key[idx] != value:
+            if missed:
+                return
+            missed = field
+    if filters.get('mbti') and filters['mbti'] not in key[6]:
+        if missed:
+            return
+        missed = 'mbti'
+
+    # A row that fails exactly one filter only counts towards that facet, so each
+    # facet reflects the current filter set minus itself.
+    for field, idx in _KEY_INDEX.items():
+        if missed is None or missed == field:
+            facets[field][key[idx]] += n
+    if missed is None or missed == 'mbti':
+        for tag in key[6]:
+            facets['mbti'][tag] += n
+
+
+def get_search_facets(filters: Dict, exclude_id: str = None,
+                      hidden: ExclusionSet = None) -> Dict[str, Dict[str, int]]:
+    """Count matching students per filter value, ignoring that facet's own filter.
+
+    ``exclude_id`` and the students in ``hidden`` are subtracted from the counts.
+    """
+    index = _facet_index_cache.get_or_load('index', _load_facet_index)
+    combos, owners = index.combos, index.owners
+    this_year = date.today().year
+    signature = (this_year,) + tuple(filters.get(f) for f in FACET_FIELDS + ('age_min', 'age_max'))
+
+    facets = _facet_cache.get(signature)
+    if facets is None:
+        facets = {field: Counter() for field in FACET_FIELDS}
+        for key, n in combos.items():
+            _add_facet_contribution(facets, key, n, filters, this_year)
+        _facet_cache.set(signature, facets)
+
+    keys = [owners[sid] for sid in itertools.chain([exclude_id], hidden or ()) if sid in owners]
+    if not keys:
+        return facets
+    adjusted = {field: Counter(counts) for field, counts in facets.items()}
+    for key in keys:
+        _add_facet_contribution(adjusted, key, -1, filters, this_year)
+    return adjusted
+
+
+def refresh_student_facets(student_id: str) -> None:
+    """Move one student's contribution to the facet counts after their profile changed."""
+    index = _facet_index_cache.get('index')
+    if index is None:
+        return  # loaded complete on the next search
+    try:
+        # from the primary: the change was just written
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_FACET_INDEX_SQL.format(where=' AND s.student_id = %s'), (student_id,))
+                row = cur.fetchone()
+    except Exception as e:
+        print(f"[DAL ERROR] refresh_student_facets failed, reloading facets: {e}")
+        invalidate_search_facets()
+        return
+    key = _facet_key(row) if row else None
+    with _facet_patch_lock:
+        old = index.owners.get(student_id)
+        if old == key:
+            return
+        # searches may be iterating the current Counter, so swap in a patched copy
+        combos = Counter(index.combos)
+        if old is not None:
+            combos[old] -= 1
+            if combos[old] <= 0:
+                del combos[old]
+            del index.owners[student_id]
+        if key is not None:
+            combos[key] += 1
+            index.owners[student_id] = key
+        index.combos = combos
+    _facet_cache.invalidate()
+
+
+def invalidate_search_facets() -> None:
+    _facet_index_cache.invalidate()
+    _facet_cache.invalidate()
+
+
+def warm_search_facets() -> None:
+    """Build the facet index now rather than on the first search."""
+    _facet_index_cache.get_or_load('index', _load_facet_index)
+
+
+# Tag catalog
+# -----------
+# Active interest tags, as listed on the registration and profile forms.
+
+_tag_cache = TTLCache('tag_catalog', ttl=TAG_CATALOG_TTL, maxsize=1)
+
+
+def _load_active_tags() -> List[Dict]:
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT tag_id, tag_name, category FROM interest_tag WHERE is_active = 1 ORDER BY category, tag_name")
+            return [{'tag_id': row[0], 'tag_name': row[1], 'category': row[2]} for row in cur.fetchall()]
+
+
+def get_active_tags() -> List[Dict]:
+    return _tag_cache.get_or_load('active', _load_active_tags)
+
+
+def invalidate_tag_catalog() -> None:
+    _tag_cache.invalidate()
+
+
+# Bulk administration
+# -------------------
+# Set-based versions of the admin toggles. Large user sets are processed in
+# ADMIN_BULK_CHUNK_SIZE transactions: a plain read picks the next keys, then
+# one UPDATE handles the whole chunk. A tag merge is a single transaction so it
+# never stops half way. Each function returns the number of rows it changed,
+# or -1 after a database error.
+
+BULK_USER_FILTERS = {
+    'college': "s.college = %s",
+    'year_of_study': "s.year_of_study = %s",
+    'identity': "s.identity = %s",
+    'id_prefix': "u.user_id LIKE CONCAT(%s, '%%')",
+}
+
+
+def _set_users_active_chunk(cur, conn, user_ids: List[str], active: bool) -> int:
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    try:
+        conn.begin()
+        cur.execute(f"""
+            UPDATE user SET is_active = %s, updated_at = NOW()
+            WHERE user_id IN ({placeholders}) AND role = 'student' AND is_active != %s
+        """, [active] + user_ids + [active])
+        affected = cur.rowcount
+        # search, facets and the profile snapshot filter on the student row
+        cur.execute(f"""
+            UPDATE student SET is_active = %s, updated_at = NOW()
+            WHERE student_id IN ({placeholders}) AND is_active != %s
+        """, [active] + user_ids + [active])
+        students = cur.rowcount
+        if affected or students:
+            actor_id = session.get('user_id') if has_request_context() else None
+            op = 'activate' if active else 'deactivate'
+            log_change(cur, 'user', 'bulk', op=op, actor_id=actor_id)
+            # many students at once, like a tag merge
+            log_change(cur, 'student', 'bulk-status', op=op, actor_id=actor_id)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"[DAL ERROR] bulk user status update failed: {e}")
+        return -1
+    if students:
+        invalidate_search_facets()
+    return affected
+
+
+def set_users_active(active: bool, user_ids: List[str] = None, filters: Dict = None) -> int:
+    """Activate or deactivate the student accounts in ``user_ids``, or matching ``filters``.
+
+    ``filters`` keys are those of BULK_USER_FILTERS; at least one must be set.
+    Admin accounts are never changed; the student rows change with the accounts,
+    so deactivated students also leave search. Returns accounts changed, or -1 if a chunk
+    failed; earlier chunks stay committed, so running it again finishes the job.
+    """
+    filters = filters or {}
+    affected = 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if user_ids is not None:
+                for i in range(0, len(user_ids), ADMIN_BULK_CHUNK_SIZE):
+                    changed = _set_users_active_chunk(cur, conn, user_ids[i:i + ADMIN_BULK_CHUNK_SIZE], active)
+                    if changed < 0:
+                        print(f"[DAL ERROR] set_users_active stopped after {affected} account(s)")
+                        return -1
+                    affected += changed
+                return affected
+
+            where = [BULK_USER_FILTERS[name] for name in BULK_USER_FILTERS if filters.get(name)]
+            if not where:
+                raise ValueError("set_users_active needs user_ids or at least one filter")
+            params = [filters[name] for name in BULK_USER_FILTERS if filters.get(name)]
+            last_id = ''
+            while True:
+                cur.execute(f"""
+                    SELECT u.user_id FROM user u
+                    JOIN student s ON s.student_id = u.user_id
+                    WHERE u.user_id > %s AND u.role = 'student' AND u.is_active != %s
+                      AND {' AND '.join(where)}
+                    ORDER BY u.user_id LIMIT %s
+                """, [last_id, active] + params + [ADMIN_BULK_CHUNK_SIZE])
+                ids = [row[0] for row in cur.fetchall()]
+                if not ids:
+                    break
+                last_id = ids[-1]
+                changed = _set_users_active_chunk(cur, conn, ids, active)
+                if changed < 0:
+                    print(f"[DAL ERROR] set_users_active stopped after {affected} account(s)")
+                    return -1
+                affected += changed
+    return affected
+
+
+def set_category_active(category: str, active: bool) -> int:
+    """Enable or disable every tag of ``category``; returns tags changed, or -1 on error."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                conn.begin()
+                cur.execute("""
+                    UPDATE interest_tag SET is_active = %s, updated_at = NOW()
+                    WHERE category = %s AND is_active != %s
+                """, (active, category, active))
+                affected = cur.rowcount
+                if affected:
+                    log_change(cur, 'tag', category, op='activate' if active else 'deactivate',
+                               actor_id=session.get('user_id') if has_request_context() else None)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"[DAL ERROR] set_category_active failed: {e}")
+                return -1
+    invalidate_tag_catalog()
+    return affected
+
+
+def merge_tags(source_id: int, target_id: int) -> int:
+    """Move every student_interest row of tag ``source_id`` to ``target_id`` and delete the source tag.
+
+    Students who already have the target tag keep one row with the earlier
+    ``created_at``. Returns the memberships moved, or -1 if the merge failed
+    and was rolled back. Raises ValueError unless both tags exist and differ.
+    """
+    if source_id == target_id:
+        raise ValueError("cannot merge a tag into itself")
+    actor_id = session.get('user_id') if has_request_context() else None
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                conn.begin()
+                cur.execute("SELECT COUNT(*) FROM interest_tag WHERE tag_id IN (%s, %s) FOR UPDATE",
+                            (source_id, target_id))
+                found = cur.fetchone()[0]
+                if found == 2:
+                    cur.execute("""
+                        INSERT INTO student_interest (student_id, tag_id, created_at)
+                        SELECT src.student_id, %s, src.created_at FROM student_interest AS src
+                        WHERE src.tag_id = %s
+                        ON DUPLICATE KEY UPDATE created_at = LEAST(student_interest.created_at, src.created_at)
+                    """, (target_id, source_id))
+                    cur.execute("DELETE FROM student_interest WHERE tag_id = %s", (source_id,))
+                    moved = cur.rowcount
+                    cur.execute("DELETE FROM interest_tag WHERE tag_id = %s", (source_id,))
+                    log_change(cur, 'tag', str(source_id), op='delete', actor_id=actor_id)
+                    # memberships of many students changed at once
+                    log_change(cur, 'student', 'tag-merge', actor_id=actor_id)
+                    conn.commit()
+                else:
+                    conn.rollback()
+            except Exception as e:
+                conn.rollback()
+                print(f"[DAL ERROR] merge_tags {source_id} -> {target_id} failed: {e}")
+                return -1
+    if found != 2:
+        raise ValueError(f"tags {source_id} and {target_id} must both exist")
+    invalidate_tag_catalog()
+    invalidate_search_facets()
+    return moved
+
+
+# Search exclusions
+# -----------------
+# Students a user has liked, invited or reported, hidden from their searches.
+# Cached per user and patched on those writes rather than re-queried.
+
+_exclusion_cache = TTLCache('search_exclusions', ttl=SEARCH_EXCLUSION_TTL, maxsize=10000)
+
+
+def _load_exclusions(student_id: str) -> ExclusionSet:
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT to_student_id FROM likes WHERE from_student_id = %s AND status = 'liked'
+                UNION
+                SELECT to_student_id FROM invitations WHERE from_student_id = %s
+                UNION
+                SELECT to_student_id FROM invitations_archive WHERE from_student_id = %s
+                UNION
+                SELECT reported_id FROM reports WHERE reporter_id = %s
+                UNION
+                SELECT reported_id FROM reports_archive WHERE reporter_id = %s
+            """, (student_id,) * 5)
+            ids = {row[0] for row in cur.fetchall()}
+    if _like_queue is not None:
+        for (from_id, to_id), status, _ in _like_queue.entries():
+            if from_id == student_id:
+                if status == 'liked':
+                    ids.add(to_id)
+                else:
+                    ids.discard(to_id)
+    return ExclusionSet(ids)
+
+
+def get_search_exclusions(student_id: str) -> ExclusionSet:
+    return _exclusion_cache.get_or_load(student_id, lambda: _load_exclusions(student_id))
+
+
+def _note_handled(student_id: str, other_id: str) -> None:
+    # only patch a cached set; an uncached one is loaded complete on next use
+    current = _exclusion_cache.get(student_id)
+    if current is not None:
+        _exclusion_cache.set(student_id, current.with_added(other_id))
+
+
+# Cross-process invalidation
+# --------------------------
+# Writes made by other workers arrive through the change_log feed.
+
+def _on_student_change(entity_id: str, actor_id: Optional[str], op: str) -> None:
+    if entity_id.isdigit():
+        refresh_student_facets(entity_id)
+    else:
+        # bulk changes such as an import or a tag merge
+        invalidate_search_facets()
+    if _snapshots is not None:
+        _snapshots.note_change(entity_id)
+
+feed.subscribe('student', _on_student_change)
+
+
+def _on_invitation_change(entity_id: str, actor_id: Optional[str], op: str) -> None:
+    # a new invitation changes the invitee's count, a response the responder's
+    _invalidate_pending_invitations(entity_id if op == 'sent' else actor_id)
+    if op == 'sent':
+        _note_handled(actor_id, entity_id)
+
+feed.subscribe('invitation', _on_invitation_change)
+
+
+def _on_like_change(entity_id: str, actor_id: Optional[str], op: str) -> None:
+    if op == 'liked':
+        _note_handled(actor_id, entity_id)
+    else:
+        # an unlike only un-hides if there was no invitation or report either
+        _exclusion_cache.invalidate(actor_id)
+
+feed.subscribe('like', _on_like_change)
+
+
+def _on_report_change(entity_id: str, actor_id: Optional[str], op: str) -> None:
+    _note_handled(actor_id, entity_id)
+
+feed.subscribe('report', _on_report_change)
+
+
+def _on_tag_change(entity_id: str, actor_id: Optional[str], op: str) -> None:
+    # facets count MBTI memberships whatever the tag's status; merges that move
+    # memberships are also logged as a bulk student change
+    invalidate_tag_catalog()
+
+feed.subscribe('tag', _on_tag_change)
@@ -0,0 +1,11 @@
+DROP TABLE IF EXISTS change_log;
+
+CREATE TABLE change_log (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    entity VARCHAR(32) NOT NULL COMMENT 'student, user, tag, like, invitation, ...',
+    entity_id VARCHAR(20) NOT NULL COMMENT 'Primary key of the changed row (target student for likes)',
+    actor_id VARCHAR(20) DEFAULT NULL COMMENT 'User that made the change, if relevant',
+    op VARCHAR(16) NOT NULL DEFAULT 'update',
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
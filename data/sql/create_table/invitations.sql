@@ -12,5 +12,8 @@ CREATE TABLE invitations (
     UNIQUE KEY unique_invitation (from_student_id, to_student_id),
     INDEX idx_from_student (from_student_id),
     INDEX idx_to_student (to_student_id),
-    INDEX idx_status (status)
+    INDEX idx_status (status),
+    INDEX idx_from_created (from_student_id, created_at, id),
+    INDEX idx_to_created (to_student_id, created_at, id),
+    INDEX idx_to_status (to_student_id, status)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
\ No newline at end of file
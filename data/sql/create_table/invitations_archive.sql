@@ -0,0 +1,14 @@
+DROP TABLE IF EXISTS invitations_archive;
+
+-- Cold rows moved out of invitations by jobs/archive_cold_rows.py (rejected or cancelled)
+CREATE TABLE invitations_archive (
+    id INT NOT NULL PRIMARY KEY COMMENT 'id the row had in invitations',
+    from_student_id VARCHAR(20) NOT NULL,
+    to_student_id VARCHAR(20) NOT NULL,
+    status ENUM('pending', 'accepted', 'rejected', 'cancelled') NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME,
+    archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_from_created (from_student_id, created_at, id),
+    INDEX idx_to_created (to_student_id, created_at, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,14 @@
+DROP TABLE IF EXISTS likes_archive;
+
+-- Cold rows moved out of likes by jobs/archive_cold_rows.py (unliked for a while)
+CREATE TABLE likes_archive (
+    id INT NOT NULL PRIMARY KEY COMMENT 'id the row had in likes',
+    from_student_id VARCHAR(20) NOT NULL,
+    to_student_id VARCHAR(20) NOT NULL,
+    status ENUM('liked', 'unliked') NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME,
+    archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_from_student (from_student_id),
+    INDEX idx_to_student (to_student_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,9 @@
+DROP TABLE IF EXISTS match_run;
+
+CREATE TABLE match_run (
+    run_id INT UNSIGNED NOT NULL PRIMARY KEY COMMENT 'Batch run, as in match_suggestion',
+    started_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at DATETIME DEFAULT NULL COMMENT 'Set once every row of the run is written; readers use completed runs only',
+    rows_written INT UNSIGNED DEFAULT NULL,
+    INDEX idx_completed (completed_at, run_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,14 @@
+DROP TABLE IF EXISTS match_suggestion;
+
+CREATE TABLE match_suggestion (
+    run_id INT UNSIGNED NOT NULL COMMENT 'Batch run, UNIX time the run started',
+    student_id CHAR(8) NOT NULL,
+    suggested_id CHAR(8) NOT NULL,
+    score DOUBLE NOT NULL COMMENT 'Symmetric pair score, higher is better',
+    rank_no SMALLINT UNSIGNED NOT NULL COMMENT '1 = best candidate for student_id in this run',
+    is_assigned BOOLEAN NOT NULL DEFAULT FALSE COMMENT 'Pair chosen by the one-to-one stable assignment',
+    PRIMARY KEY (run_id, student_id, suggested_id),
+    FOREIGN KEY (student_id) REFERENCES student(student_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (suggested_id) REFERENCES student(student_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    INDEX idx_student_run (student_id, run_id, rank_no)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,20 @@
+DROP TABLE IF EXISTS report_queue;
+
+CREATE TABLE report_queue (
+    reported_id VARCHAR(20) NOT NULL PRIMARY KEY,
+    report_count INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Pending reports against this user',
+    reporter_count INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Distinct reporters among pending reports',
+    first_reported_at DATETIME NOT NULL,
+    last_reported_at DATETIME NOT NULL,
+    priority DOUBLE NOT NULL DEFAULT 0 COMMENT 'Moderation priority, higher is more urgent',
+    FOREIGN KEY (reported_id) REFERENCES user(user_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    INDEX idx_priority (priority, reported_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Backfill from existing pending reports (re-run after loading sql_data/reports_*.sql)
+INSERT INTO report_queue (reported_id, report_count, reporter_count, first_reported_at, last_reported_at, priority)
+SELECT reported_id, COUNT(*), COUNT(DISTINCT reporter_id), MIN(created_at), MAX(created_at),
+       COUNT(DISTINCT reporter_id) * 5 + COUNT(*) + UNIX_TIMESTAMP(MAX(created_at)) / 86400
+FROM reports
+WHERE status = 'pending'
+GROUP BY reported_id;
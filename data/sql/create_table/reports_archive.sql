@@ -0,0 +1,16 @@
+DROP TABLE IF EXISTS reports_archive;
+
+-- Cold rows moved out of reports by jobs/archive_cold_rows.py (resolved)
+CREATE TABLE reports_archive (
+    id INT NOT NULL PRIMARY KEY COMMENT 'id the row had in reports',
+    reporter_id VARCHAR(20) NOT NULL,
+    reported_id VARCHAR(20) NOT NULL,
+    reason VARCHAR(255) NOT NULL,
+    description TEXT,
+    status ENUM('pending', 'reviewed', 'resolved') NOT NULL,
+    created_at DATETIME,
+    resolved_at DATETIME NULL,
+    archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_reporter (reporter_id),
+    INDEX idx_reported (reported_id, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
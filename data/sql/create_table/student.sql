@@ -37,7 +37,10 @@ CREATE TABLE student (
     
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_name (name),
     INDEX idx_college_gender (college, gender),
+    INDEX idx_college_created (college, created_at),
+    INDEX idx_college_active_created (college, is_active, created_at),
     INDEX idx_year (year_of_study),
     INDEX idx_identity (identity),
     INDEX idx_marital_status (marital_status)
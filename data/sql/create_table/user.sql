@@ -8,6 +8,9 @@ CREATE TABLE user (
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
-    INDEX idx_role (role),
+    INDEX idx_role_active_created (role, is_active, created_at),
+    INDEX idx_role_created (role, created_at),
+    INDEX idx_active_created (is_active, created_at),
+    INDEX idx_created (created_at),
     INDEX idx_user_id_role (user_id, role)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
\ No newline at end of file
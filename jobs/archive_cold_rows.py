@@ -0,0 +1,102 @@
+# jobs/archive_cold_rows.py
+"""Move cold rows from likes, invitations and reports into their archive tables.
+
+    python -m jobs.archive_cold_rows [--table likes] [--days N] [--batch-size N] [--pause SECONDS]
+
+Each batch:
+
+1. finds the next ids that are cold with a plain (non-locking) read that walks
+   the primary key from where the previous batch stopped,
+2. in one short transaction, locks exactly those rows by primary key while
+   re-checking that they are still cold, copies them into the archive and
+   deletes them from the hot table,
+3. pauses before the next batch.
+
+A row that changed between steps 1 and 2 (e.g. a like toggled back on) fails
+the re-check and stays in the hot table. Rows moved per second are printed for
+each table. See archive.py for reading the archived rows.
+"""
+import argparse
+import time
+
+from archive import ARCHIVES, ArchiveSpec
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_BATCH_PAUSE
+
+
+def archive_table(conn, spec: ArchiveSpec, days: int, batch_size: int, pause: float) -> dict:
+    cold = f"{spec.cold} AND {spec.cold_since} < NOW() - INTERVAL %s DAY"
+    moved = 0
+    batches = 0
+    last_id = 0
+    start = time.monotonic()
+
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(f"""
+                SELECT id FROM {spec.table}
+                WHERE id > %s AND {cold}
+                ORDER BY id LIMIT %s
+            """, (last_id, days, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            placeholders = ', '.join(['%s'] * len(ids))
+            try:
+                conn.begin()
+                cur.execute(f"""
+                    SELECT id FROM {spec.table}
+                    WHERE id IN ({placeholders}) AND {cold}
+                    FOR UPDATE
+                """, ids + [days])
+                locked = [row[0] for row in cur.fetchall()]
+                if locked:
+                    placeholders = ', '.join(['%s'] * len(locked))
+                    cur.execute(f"""
+                        INSERT INTO {spec.archive} ({spec.columns})
+                        SELECT {spec.columns} FROM {spec.table} WHERE id IN ({placeholders})
+                    """, locked)
+                    cur.execute(f"DELETE FROM {spec.table} WHERE id IN ({placeholders})", locked)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"[ARCHIVE ERROR] {spec.table} batch after id {ids[0] - 1} failed: {e}")
+                break
+
+            moved += len(locked)
+            batches += 1
+            if len(ids) < batch_size:
+                break
+            time.sleep(pause)
+
+    seconds = time.monotonic() - start
+    return {
+        'table': spec.table,
+        'rows': moved,
+        'batches': batches,
+        'seconds': round(seconds, 1),
+        'rows_per_second': round(moved / seconds, 1) if seconds else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--table', choices=sorted(ARCHIVES), action='append',
+                        help='archive only this table (repeatable); default all')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=ARCHIVE_BATCH_PAUSE)
+    args = parser.parse_args(argv)
+
+    from dal import get_connection
+    with get_connection() as conn:
+        for table in args.table or ARCHIVES:
+            stats = archive_table(conn, ARCHIVES[table], args.days, args.batch_size, args.pause)
+            print(f"[ARCHIVE] {stats['table']}: {stats['rows']} rows in {stats['batches']} batches, "
+                  f"{stats['seconds']}s ({stats['rows_per_second']} rows/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,354 @@
+# jobs/batch_matching.py
+"""Offline batch matching: suggested pairings for every active student.
+
+    python -m jobs.batch_matching [--workers N] [--top-k K] [--time-budget SECONDS] [--dry-run]
+
+1. Load active, unreported students with their interest tags, the likes graph
+   and the pairs that must never be suggested: existing matches (accepted
+   invitations or mutual likes) and pairs where one reported the other.
+2. Score candidates in a process pool, one shard of students per task. A
+   student's candidates are the students sharing an interest tag (each tag's
+   posting list is capped at MATCH_JOB_MAX_POSTING; the more common a tag is,
+   the less it weighs) plus the students they liked or were liked by. The
+   shortlist is rescored exactly:
+
+       score(a, b) = cosine(idf-weighted tags of a, b) + LIKE_BONUS * (a liked b) + LIKE_BONUS * (b liked a)
+
+   The top-k of every student is streamed into match_suggestion while the
+   remaining shards are still being scored.
+3. Pick a one-to-one assignment from the union of the top-k lists. Because
+   the pair score is symmetric, taking pairs in descending score order gives
+   the stable matching, i.e. what Gale-Shapley deferred acceptance converges
+   to for these preferences: no two students would both rather have each
+   other than the partner they were given.
+
+Each run is registered in match_run and marked complete only after its last
+row is written. Readers must take the newest completed run, never the newest
+run_id in match_suggestion:
+
+    SELECT suggested_id, score, is_assigned FROM match_suggestion
+    WHERE student_id = %s AND run_id = (SELECT MAX(run_id) FROM match_run WHERE completed_at IS NOT NULL)
+    ORDER BY rank_no
+
+so a run still being written is never seen. A run that exceeds the time
+budget is abandoned and its rows deleted.
+"""
+import argparse
+import heapq
+import math
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import pymysql
+
+from config import (MATCH_JOB_TOP_K, MATCH_JOB_WORKERS, MATCH_JOB_SHARD_SIZE, MATCH_JOB_MAX_POSTING,
+                    MATCH_JOB_LIKE_BONUS, MATCH_JOB_BATCH_SIZE, MATCH_JOB_TIME_BUDGET, MATCH_JOB_KEEP_RUNS)
+
+Suggestions = List[Tuple[str, float]]
+
+
+class MatchData(NamedTuple):
+    tags: Dict[str, FrozenSet[int]]   # every eligible student, possibly with no tags
+    likes: Dict[str, Set[str]]        # liker -> liked, eligible students only
+    excluded: Dict[str, Set[str]]     # student -> students never suggested to them
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+# Loading
+# -------
+
+def load_data() -> MatchData:
+    from dal import get_read_connection
+
+    with get_read_connection() as conn:
+        with conn.cursor(pymysql.cursors.SSCursor) as cur:
+            cur.execute("""
+                SELECT s.student_id
+                FROM student s
+                JOIN user u ON u.user_id = s.student_id
+                WHERE s.is_active = 1 AND u.is_active = 1
+                  AND NOT EXISTS (SELECT 1 FROM report_queue rq WHERE rq.reported_id = s.student_id)
+            """)
+            members = {row[0]: set() for row in cur}
+
+            cur.execute("""
+                SELECT si.student_id, si.tag_id
+                FROM student_interest si
+                JOIN interest_tag it ON it.tag_id = si.tag_id AND it.is_active = 1
+            """)
+            for student_id, tag_id in cur:
+                tag_set = members.get(student_id)
+                if tag_set is not None:
+                    tag_set.add(tag_id)
+
+            likes = defaultdict(set)
+            cur.execute("SELECT from_student_id, to_student_id FROM likes WHERE status = 'liked'")
+            for from_id, to_id in cur:
+                if from_id in members and to_id in members:
+                    likes[from_id].add(to_id)
+
+            excluded = defaultdict(set)
+            cur.execute("""
+                SELECT from_student_id, to_student_id FROM invitations WHERE status = 'accepted'
+                UNION ALL
+                SELECT reporter_id, reported_id FROM reports
+                UNION ALL
+                SELECT reporter_id, reported_id FROM reports_archive
+            """)
+            for a, b in cur:
+                excluded[a].add(b)
+                excluded[b].add(a)
+
+    for a, liked in likes.items():
+        for b in liked:
+            if a in likes.get(b, ()):
+                excluded[a].add(b)
+
+    tags = {student_id: frozenset(tag_set) for student_id, tag_set in members.items()}
+    return MatchData(tags, dict(likes), dict(excluded))
+
+
+# Scoring (runs in the worker processes)
+# --------------------------------------
+
+_data: Optional[MatchData] = None
+_liked_by: Dict[str, Set[str]] = {}
+_postings: Dict[int, List[str]] = {}
+_idf_sq: Dict[int, float] = {}
+_norm: Dict[str, float] = {}
+_params: dict = {}
+
+
+def _init_worker(data: MatchData, top_k: int, max_posting: int, like_bonus: float) -> None:
+    global _data, _liked_by, _postings, _idf_sq, _norm, _params
+    _data = data
+    _params = {'top_k': top_k, 'like_bonus': like_bonus}
+
+    _liked_by = defaultdict(set)
+    for a, liked in data.likes.items():
+        for b in liked:
+            _liked_by[b].add(a)
+
+    postings = defaultdict(list)
+    for student_id, tag_set in data.tags.items():
+        for tag in tag_set:
+            postings[tag].append(student_id)
+    n = len(data.tags) or 1
+    _idf_sq = {tag: math.log(1 + n / len(ids)) ** 2 for tag, ids in postings.items()}
+    for tag, ids in postings.items():
+        if len(ids) > max_posting:
+            ids.sort()
+            random.Random(tag).shuffle(ids)
+            postings[tag] = ids[:max_posting]
+    _postings = dict(postings)
+    _norm = {student_id: math.sqrt(sum(_idf_sq[t] for t in tag_set)) or 1.0
+             for student_id, tag_set in data.tags.items()}
+
+
+def _pair_score(a: str, b: str) -> float:
+    tags_a, tags_b = _data.tags[a], _data.tags[b]
+    shared = tags_a & tags_b
+    score = sum(_idf_sq[t] for t in shared) / (_norm[a] * _norm[b]) if shared else 0.0
+    if b in _data.likes.get(a, ()):
+        score += _params['like_bonus']
+    if a in _data.likes.get(b, ()):
+        score += _params['like_bonus']
+    return score
+
+
+def _score_student(a: str) -> Suggestions:
+    top_k = _params['top_k']
+    excluded = _data.excluded.get(a, ())
+
+    # Partial overlap from the capped posting lists, only used to shortlist.
+    overlap = defaultdict(float)
+    for tag in _data.tags[a]:
+        weight = _idf_sq[tag]
+        for b in _postings[tag]:
+            overlap[b] += weight
+    overlap.pop(a, None)
+    shortlist = set(heapq.nlargest(top_k * 3, overlap, key=lambda b: overlap[b] / _norm[b]))
+    shortlist |= _data.likes.get(a, set()) | _liked_by.get(a, set())
+    shortlist.discard(a)
+
+    scored = [(b, _pair_score(a, b)) for b in shortlist if b not in excluded]
+    return heapq.nlargest(top_k, (pair for pair in scored if pair[1] > 0), key=lambda pair: (pair[1], pair[0]))
+
+
+def _score_shard(student_ids: List[str]) -> List[Tuple[str, Suggestions]]:
+    return [(a, _score_student(a)) for a in student_ids]
+
+
+# Assignment
+# ----------
+
+def stable_assignment(edges: Dict[Tuple[str, str], float]) -> List[Tuple[str, str, float]]:
+    """One-to-one pairs from symmetric scores, best pairs first.
+
+    With symmetric preferences, a pair that both sides rank above their
+    eventual partners would have been taken earlier, so the result is stable.
+    """
+    taken = set()
+    pairs = []
+    for (a, b), score in sorted(edges.items(), key=lambda item: (-item[1], item[0])):
+        if a in taken or b in taken:
+            continue
+        taken.add(a)
+        taken.add(b)
+        pairs.append((a, b, score))
+    return pairs
+
+
+# Writing
+# -------
+
+class SuggestionWriter:
+    def __init__(self, run_id: int, batch_size: int, top_k: int):
+        from dal import get_connection
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.top_k = top_k
+        self.rows_written = 0
+        self._buffer = []
+        self._conn = get_connection()
+        with self._conn.cursor() as cur:
+            cur.execute("INSERT INTO match_run (run_id) VALUES (%s)", (run_id,))
+
+    def add(self, student_id: str, suggestions: Suggestions) -> None:
+        for rank_no, (suggested_id, score) in enumerate(suggestions, 1):
+            self._buffer.append((self.run_id, student_id, suggested_id, score, rank_no))
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        with self._conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO match_suggestion (run_id, student_id, suggested_id, score, rank_no)
+                VALUES (%s, %s, %s, %s, %s)
+            """, self._buffer)
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def assign(self, pairs: Iterable[Tuple[str, str, float]]) -> None:
+        self._flush()
+        # A partner can come from the other student's list only; such rows are
+        # inserted ranked just past this student's own top-k.
+        rows = []
+        for a, b, score in pairs:
+            rows.append((self.run_id, a, b, score, self.top_k + 1))
+            rows.append((self.run_id, b, a, score, self.top_k + 1))
+        with self._conn.cursor() as cur:
+            for i in range(0, len(rows), self.batch_size):
+                cur.executemany("""
+                    INSERT INTO match_suggestion (run_id, student_id, suggested_id, score, rank_no, is_assigned)
+                    VALUES (%s, %s, %s, %s, %s, 1)
+                    ON DUPLICATE KEY UPDATE is_assigned = 1
+                """, rows[i:i + self.batch_size])
+
+    def finish(self, keep_runs: int) -> None:
+        self._flush()
+        with self._conn.cursor() as cur:
+            # the run becomes visible to readers here, in one statement
+            cur.execute("UPDATE match_run SET completed_at = NOW(), rows_written = %s WHERE run_id = %s",
+                        (self.rows_written, self.run_id))
+            cur.execute("""
+                SELECT run_id FROM match_run WHERE completed_at IS NOT NULL
+                ORDER BY run_id DESC LIMIT %s
+            """, (keep_runs,))
+            kept = [row[0] for row in cur.fetchall()]
+            if kept:
+                # older runs, including any a crash left incomplete
+                cur.execute("DELETE FROM match_suggestion WHERE run_id < %s", (min(kept),))
+                cur.execute("DELETE FROM match_run WHERE run_id < %s", (min(kept),))
+        self._conn.close()
+
+    def abandon(self) -> None:
+        self._buffer = []
+        with self._conn.cursor() as cur:
+            cur.execute("DELETE FROM match_suggestion WHERE run_id = %s", (self.run_id,))
+            cur.execute("DELETE FROM match_run WHERE run_id = %s", (self.run_id,))
+        self._conn.close()
+
+
+# Driver
+# ------
+
+def run(data: MatchData, writer: Optional[SuggestionWriter] = None, top_k: int = MATCH_JOB_TOP_K,
+        workers: Optional[int] = MATCH_JOB_WORKERS, time_budget: float = MATCH_JOB_TIME_BUDGET,
+        shard_size: int = MATCH_JOB_SHARD_SIZE, max_posting: int = MATCH_JOB_MAX_POSTING,
+        like_bonus: float = MATCH_JOB_LIKE_BONUS) -> Dict:
+    """Score, assign and (with a writer) store one run. Returns timing stats."""
+    start = time.monotonic()
+    deadline = start + time_budget
+    student_ids = sorted(data.tags)
+    shards = [student_ids[i:i + shard_size] for i in range(0, len(student_ids), shard_size)]
+
+    edges = {}
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(data, top_k, max_posting, like_bonus)) as pool:
+        results = pool.imap_unordered(_score_shard, shards)
+        for _ in shards:
+            try:
+                shard = results.next(timeout=max(deadline - time.monotonic(), 0))
+            except multiprocessing.TimeoutError:
+                pool.terminate()
+                raise BudgetExceeded(f"scoring did not finish within {time_budget:g}s")
+            for a, suggestions in shard:
+                if writer is not None:
+                    writer.add(a, suggestions)
+                for b, score in suggestions:
+                    edges[(a, b) if a < b else (b, a)] = score
+    scored_at = time.monotonic()
+
+    pairs = stable_assignment(edges)
+    if time.monotonic() > deadline:
+        raise BudgetExceeded(f"assignment did not finish within {time_budget:g}s")
+    if writer is not None:
+        writer.assign(pairs)
+    return {
+        'students': len(student_ids),
+        'edges': len(edges),
+        'pairs': len(pairs),
+        'score_seconds': round(scored_at - start, 2),
+        'total_seconds': round(time.monotonic() - start, 2),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=MATCH_JOB_WORKERS)
+    parser.add_argument('--top-k', type=int, default=MATCH_JOB_TOP_K)
+    parser.add_argument('--time-budget', type=float, default=MATCH_JOB_TIME_BUDGET)
+    parser.add_argument('--dry-run', action='store_true', help='score and assign without writing')
+    args = parser.parse_args(argv)
+
+    load_start = time.monotonic()
+    data = load_data()
+    print(f"[MATCH JOB] loaded {len(data.tags)} students in {time.monotonic() - load_start:.1f}s")
+
+    writer = None if args.dry_run else SuggestionWriter(int(time.time()), MATCH_JOB_BATCH_SIZE, args.top_k)
+    remaining = args.time_budget - (time.monotonic() - load_start)
+    try:
+        stats = run(data, writer, top_k=args.top_k, workers=args.workers, time_budget=remaining)
+    except BudgetExceeded as e:
+        print(f"[MATCH JOB ERROR] {e}; run abandoned")
+        if writer is not None:
+            writer.abandon()
+        return 1
+    if writer is not None:
+        writer.finish(MATCH_JOB_KEEP_RUNS)
+        stats['rows_written'] = writer.rows_written
+    print(f"[MATCH JOB] {stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+# jobs/build_profile_snapshot.py
+"""Export active students into a memory-mapped profile snapshot for search.
+
+    python -m jobs.build_profile_snapshot [--dir DIR] [--keep N] [--every SECONDS]
+
+Reads every active student and their interest tags in one consistent-snapshot
+transaction, writes a new ``profiles-<built_at>.snap`` version and makes it
+CURRENT; workers pick it up within PROFILE_SNAPSHOT_CHECK_INTERVAL seconds.
+See profile_snapshot.py for the file layout. With ``--every`` the export is
+repeated until interrupted; otherwise run it from cron more often than
+PROFILE_SNAPSHOT_MAX_AGE.
+"""
+import argparse
+import time
+from array import array
+from typing import List, Tuple
+
+import pymysql
+
+from config import PROFILE_SNAPSHOT_DIR, PROFILE_SNAPSHOT_KEEP
+from profile_snapshot import SNAPSHOT_COLUMNS, SnapshotRow, publish_snapshot
+
+
+def export(conn) -> Tuple[float, List[SnapshotRow], List[Tuple[str, str]], List[array]]:
+    with conn.cursor() as cur:
+        # taken before the transaction starts, so the exported state is at least this new
+        cur.execute("SELECT UNIX_TIMESTAMP(NOW(6))")
+        built_at = float(cur.fetchone()[0])
+        cur.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+    try:
+        with conn.cursor(pymysql.cursors.SSCursor) as cur:
+            cur.execute(f"""
+                SELECT {SNAPSHOT_COLUMNS}
+                FROM student s
+                WHERE s.is_active = 1
+                ORDER BY s.updated_at DESC, s.student_id
+            """)
+            rows = [SnapshotRow._make(row) for row in cur]
+            row_of = {row.student_id: i for i, row in enumerate(rows)}
+
+            cur.execute("SELECT tag_id, tag_name, category FROM interest_tag ORDER BY tag_id")
+            tags = []
+            tag_index = {}
+            for tag_id, tag_name, category in cur:
+                tag_index[tag_id] = len(tags)
+                tags.append((tag_name, category))
+
+            tag_rows = [array('I') for _ in tags]
+            cur.execute("SELECT student_id, tag_id FROM student_interest")
+            for student_id, tag_id in cur:
+                row = row_of.get(student_id)
+                if row is not None and tag_id in tag_index:
+                    tag_rows[tag_index[tag_id]].append(row)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return built_at, rows, tags, [array('I', sorted(members)) for members in tag_rows]
+
+
+def build(directory: str, keep: int) -> str:
+    from dal import get_connection
+    start = time.monotonic()
+    with get_connection() as conn:
+        built_at, rows, tags, tag_rows = export(conn)
+    exported = time.monotonic() - start
+    path = publish_snapshot(directory, built_at, rows, tags, tag_rows, keep)
+    print(f"[SNAPSHOT] {len(rows)} students, {len(tags)} tags: exported in {exported:.1f}s, "
+          f"wrote {path} in {time.monotonic() - start - exported:.1f}s")
+    return path
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', default=PROFILE_SNAPSHOT_DIR)
+    parser.add_argument('--keep', type=int, default=PROFILE_SNAPSHOT_KEEP, help='versions kept on disk')
+    parser.add_argument('--every', type=float, help='rebuild every this many seconds')
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("PROFILE_SNAPSHOT_DIR is not set; pass --dir")
+
+    while True:
+        try:
+            build(args.dir, args.keep)
+        except Exception as e:
+            print(f"[SNAPSHOT ERROR] build failed: {e}")
+            if not args.every:
+                return 1
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,35 @@
+# jobs/import_cohort.py
+"""Import a cohort of student accounts from a CSV file.
+
+    python -m jobs.import_cohort students.csv [--default-password PW] [--errors errors.csv] [--workers N]
+
+See cohort_import.py for the accepted columns. Rejected rows are written to
+the ``--errors`` file (default: <input>.errors.csv) with their line numbers.
+"""
+import argparse
+
+from cohort_import import import_cohort
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv_path')
+    parser.add_argument('--default-password', help='initial password for rows without a password column')
+    parser.add_argument('--errors', help='where to write rejected rows')
+    parser.add_argument('--workers', type=int, help='password hashing threads; default one per CPU')
+    args = parser.parse_args(argv)
+
+    with open(args.csv_path, newline='', encoding='utf-8-sig') as f:
+        result = import_cohort(f, default_password=args.default_password, workers=args.workers)
+
+    print(f"[IMPORT] {result.imported} imported, {len(result.errors)} rejected in {result.seconds}s")
+    if result.errors:
+        errors_path = args.errors or args.csv_path + '.errors.csv'
+        with open(errors_path, 'w', newline='', encoding='utf-8') as f:
+            f.write(result.errors_csv())
+        print(f"[IMPORT] rejected rows written to {errors_path}")
+    return 1 if result.errors and not result.imported else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,177 @@
+# metrics.py
+"""In-process metrics exposed in the Prometheus text format at ``/metrics``.
+
+The hot path (one request) costs a couple of dict updates and a bisect, with no
+dependency on prometheus_client. Counts are per process; run one scrape target
+per worker.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple
+
+from flask import Response, abort, g, request
+
+_lock = threading.Lock()
+_local = threading.local()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 1.0)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self, kind: str = 'counter'):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {kind}"
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {value:g}"
+
+
+class Gauge(Counter):
+    def dec(self, *label_values) -> None:
+        self.inc(*label_values, amount=-1)
+
+    def render(self, kind: str = 'gauge'):
+        return super().render(kind)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., +Inf count, sum]
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        idx = bisect_left(self.buckets, value)
+        with _lock:
+            slot = self.values.get(label_values)
+            if slot is None:
+                slot = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            slot[idx] += 1
+            slot[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, slot in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), slot):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                yield (f"{self.name}_bucket"
+                       f"{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {slot[-1]:g}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+def _labels(names: Tuple, values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+requests_total = Counter('http_requests_total', 'Requests handled.', ('blueprint', 'endpoint', 'status'))
+request_seconds = Histogram('http_request_duration_seconds', 'Request latency.', LATENCY_BUCKETS,
+                            ('blueprint', 'endpoint'))
+in_flight = Gauge('http_requests_in_flight', 'Requests currently being handled.')
+db_queries_per_request = Histogram('db_queries_per_request', 'Database queries issued per request.',
+                                   QUERY_BUCKETS, ('endpoint',))
+db_queries_total = Counter('db_queries_total', 'Database queries issued.')
+db_connections_total = Counter('db_connections_opened_total', 'Database connections opened.', ('target',))
+bcrypt_seconds = Histogram('bcrypt_seconds', 'Time spent hashing or checking passwords.', BCRYPT_BUCKETS,
+                           ('op',))
+
+_registry = [requests_total, request_seconds, in_flight, db_queries_per_request,
+             db_queries_total, db_connections_total, bcrypt_seconds]
+
+
+def register(metric) -> None:
+    """Expose an additional metric created by another module."""
+    _registry.append(metric)
+
+
+def record_db_query() -> None:
+    db_queries_total.inc()
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+def record_db_connection(target: str) -> None:
+    db_connections_total.inc(target)
+
+
+@contextmanager
+def time_bcrypt(op: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        bcrypt_seconds.observe(time.perf_counter() - start, op)
+
+
+def _render_caches():
+    from cache import all_caches
+    caches = all_caches()
+    yield "# HELP cache_requests_total Cache lookups by result."
+    yield "# TYPE cache_requests_total counter"
+    for name, c in sorted(caches.items()):
+        yield f'cache_requests_total{{cache="{name}",result="hit"}} {c.hits}'
+        yield f'cache_requests_total{{cache="{name}",result="miss"}} {c.misses}'
+    yield "# HELP cache_hit_ratio Share of lookups served from cache."
+    yield "# TYPE cache_hit_ratio gauge"
+    for name, c in sorted(caches.items()):
+        total = c.hits + c.misses
+        yield f'cache_hit_ratio{{cache="{name}"}} {c.hits / total if total else 0:g}'
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.extend(_render_caches())
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app, allowed_ips: Sequence[str] = ()) -> None:
+    """Install request instrumentation and the ``/metrics`` endpoint."""
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        _local.queries = 0
+        in_flight.inc()
+
+    @app.after_request
+    def _capture_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record(exc):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        in_flight.dec()
+        endpoint = request.endpoint or 'unmatched'
+        blueprint = request.blueprint or 'app'
+        status = 500 if exc is not None else g.pop('_metrics_status', 500)
+        request_seconds.observe(time.perf_counter() - start, blueprint, endpoint)
+        requests_total.inc(blueprint, endpoint, status)
+        db_queries_per_request.observe(getattr(_local, 'queries', 0), endpoint)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if allowed_ips and request.remote_addr not in allowed_ips:
+            abort(404)
+        return Response(render(), mimetype='text/plain; version=0.0.4')
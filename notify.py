@@ -0,0 +1,106 @@
+# notify.py
+"""Per-user push notifications for the ``/matching/events`` stream.
+
+``broker`` is an in-process pub/sub: each open event stream holds one
+Subscription, a bounded deque plus an Event to wake the stream when something
+arrives. An idle stream costs one of each and a suspended generator.
+
+Events are not published by the request that makes the write. They come from
+the change_log feed, which every worker process tails, so a student gets the
+event whichever worker their stream is connected to. Delivery therefore lags
+the write by up to CHANGE_FEED_INTERVAL. A message bus (Redis pub/sub, NOTIFY)
+could replace the feed later by calling ``broker.publish`` from its listener.
+
+A thread-per-request server keeps one thread per open stream. To hold
+thousands of idle streams, run under gevent (``gunicorn -k gevent``); its
+monkey-patching makes the Event waits cooperative.
+"""
+import threading
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from changefeed import feed
+from config import SSE_MAX_CONNECTIONS
+
+Message = Tuple[str, dict]
+
+
+class Subscription:
+    __slots__ = ('user_id', '_messages', '_ready')
+
+    def __init__(self, user_id: str, max_pending: int):
+        self.user_id = user_id
+        self._messages = deque(maxlen=max_pending)  # a stalled client drops its oldest events
+        self._ready = threading.Event()
+
+    def push(self, message: Message) -> None:
+        self._messages.append(message)
+        self._ready.set()
+
+    def wait(self, timeout: float) -> List[Message]:
+        """Messages published since the last call; empty after ``timeout`` seconds."""
+        if not self._messages:
+            self._ready.wait(timeout)
+        self._ready.clear()
+        drained = []
+        while self._messages:
+            drained.append(self._messages.popleft())
+        return drained
+
+
+class Broker:
+    def __init__(self, max_connections: int = 5000, max_pending: int = 100):
+        self.max_connections = max_connections
+        self.max_pending = max_pending
+        self.connections = 0
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: str) -> Optional[Subscription]:
+        """Open a subscription, or return None when the process is at capacity."""
+        with self._lock:
+            if self.connections >= self.max_connections:
+                return None
+            sub = Subscription(user_id, self.max_pending)
+            self._subscribers[user_id].add(sub)
+            self.connections += 1
+            return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs is None or sub not in subs:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.user_id]
+            self.connections -= 1
+
+    def publish(self, user_id: str, event: str, data: dict) -> None:
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        for sub in subs:
+            sub.push((event, data))
+
+
+broker = Broker(max_connections=SSE_MAX_CONNECTIONS)
+
+
+# Feed listeners
+# --------------
+# invitation rows: 'sent' is logged against the invitee, responses against the
+# inviter; like rows are logged against the student who was liked.
+
+def _on_invitation(entity_id: str, actor_id: Optional[str], op: str) -> None:
+    if op == 'sent':
+        broker.publish(entity_id, 'invitation', {'from': actor_id})
+    elif op in ('accepted', 'rejected'):
+        broker.publish(entity_id, 'invitation_response', {'by': actor_id, 'status': op})
+
+
+def _on_like(entity_id: str, actor_id: Optional[str], op: str) -> None:
+    if op == 'liked':
+        broker.publish(entity_id, 'like', {'from': actor_id})
+
+feed.subscribe('invitation', _on_invitation)
+feed.subscribe('like', _on_like)
@@ -1,7 +1,17 @@
 # pages/admin.py
-from flask import Blueprint, render_template, session, redirect, url_for, request, flash
+from flask import Blueprint, render_template, session, redirect, url_for, request, flash, current_app, Response
 from functools import wraps
-from dal import get_connection
+from changefeed import log_change
+from archive import union_with_archive
+from profiler import profiler
+from cache import TTLCache
+from cohort_import import import_cohort, COLLEGES, IDENTITIES
+from config import IMPORT_WEB_MAX_ROWS
+import csv
+import io
+import re
+import secrets
+from dal import get_connection, get_read_connection, get_report_queue, resolve_reports_for, delete_reports_for, update_report, invalidate_tag_catalog, set_users_active, set_category_active, merge_tags
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -18,7 +28,7 @@ def admin_required(f):
 def dashboard():
     stats = {}
     
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT COUNT(*) FROM user WHERE role = 'student' AND is_active = 1")
             stats['active_students'] = cur.fetchone()[0]
@@ -29,7 +39,9 @@ def dashboard():
             cur.execute("SELECT COUNT(*) FROM interest_tag")
             stats['total_tags'] = cur.fetchone()[0]
             
-            cur.execute("SELECT COUNT(*) FROM invitations")
+            cur.execute("""
+                SELECT (SELECT COUNT(*) FROM invitations) + (SELECT COUNT(*) FROM invitations_archive)
+            """)
             stats['total_invitations'] = cur.fetchone()[0]
             
             cur.execute("SELECT COUNT(*) FROM invitations WHERE status = 'accepted'")
@@ -74,44 +86,126 @@ def dashboard():
     return render_template('admin/dashboard.html', stats=stats)
 
 
+_user_count_cache = TTLCache('admin_user_count', ttl=60, maxsize=1)
+
+
+def _count_users() -> int:
+    with get_read_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM user")
+            return cur.fetchone()[0]
+
+
+def _like_prefix(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
 @bp.route('/users')
-@bp.route('/users/page/<int:page>')
 @admin_required
-def user_management(page=1):
+def user_management():
     per_page = 10
-    offset = (page - 1) * per_page
+    query = request.args.get('q', '').strip()
+    role_filter = request.args.get('role', '')
+    status_filter = request.args.get('status', '')
+    college_filter = request.args.get('college', '')
+    after = request.args.get('after', '')
     
-    users = []
-    total_count = 0
+    # Only combinations with an index that both filters and orders are offered;
+    # anything else would walk an index discarding non-matching rows. A search
+    # therefore ignores the filters.
+    if query and (role_filter or status_filter or college_filter):
+        flash("Search by ID or name ignores the role, status and college filters", "info")
+        role_filter = status_filter = college_filter = ''
     
-    with get_connection() as conn:
+    sql = """
+        SELECT u.user_id, u.role, u.is_active, u.created_at,
+               s.name, s.college, s.major, s.created_at
+        FROM user u
+        LEFT JOIN student s ON u.user_id = s.student_id
+        WHERE 1=1
+    """
+    params = []
+    
+    if college_filter:
+        # student rows only, walked by student.idx_college_created or
+        # idx_college_active_created (student.is_active follows user.is_active)
+        if role_filter == 'admin':
+            sql += " AND 1=0"
+        if status_filter in ('0', '1'):
+            sql += " AND s.is_active = %s"
+            params.append(int(status_filter))
+        sql += " AND s.college = %s"
+        params.append(college_filter)
+    else:
+        # user.idx_role_created, idx_active_created, idx_role_active_created or idx_created
+        if role_filter:
+            sql += " AND u.role = %s"
+            params.append(role_filter)
+        if status_filter in ('0', '1'):
+            sql += " AND u.is_active = %s"
+            params.append(int(status_filter))
+    
+    # Keyset paging: each ordering walks the index above, PRIMARY or
+    # student.idx_name from the ``after`` cursor, so a page reads at most
+    # per_page + 1 index entries however deep it is.
+    if query.isdigit():
+        sql += " AND u.user_id LIKE %s"
+        params.append(_like_prefix(query))
+        if after:
+            sql += " AND u.user_id > %s"
+            params.append(after)
+        sql += " ORDER BY u.user_id"
+    elif query:
+        sql += " AND s.name LIKE %s"
+        params.append(_like_prefix(query))
+        if after and ':' in after:
+            name, user_id = after.rsplit(':', 1)
+            sql += " AND (s.name > %s OR (s.name = %s AND s.student_id > %s))"
+            params.extend([name, name, user_id])
+        sql += " ORDER BY s.name, s.student_id"
+    elif college_filter:
+        if after and ':' in after:
+            created_at, user_id = after.rsplit(':', 1)
+            sql += " AND (s.created_at < %s OR (s.created_at = %s AND s.student_id < %s))"
+            params.extend([created_at, created_at, user_id])
+        sql += " ORDER BY s.created_at DESC, s.student_id DESC"
+    else:
+        if after and ':' in after:
+            created_at, user_id = after.rsplit(':', 1)
+            sql += " AND (u.created_at < %s OR (u.created_at = %s AND u.user_id < %s))"
+            params.extend([created_at, created_at, user_id])
+        sql += " ORDER BY u.created_at DESC, u.user_id DESC"
+    sql += " LIMIT %s"
+    params.append(per_page + 1)
+    
+    with get_read_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM user")
-            total_count = cur.fetchone()[0]
-            
-            cur.execute("""
-                SELECT u.user_id, u.role, u.is_active, u.created_at,
-                       s.name, s.college, s.major
-                FROM user u
-                LEFT JOIN student s ON u.user_id = s.student_id
-                ORDER BY u.created_at DESC
-                LIMIT %s OFFSET %s
-            """, (per_page, offset))
+            cur.execute(sql, params)
             users = cur.fetchall()
     
-    total_pages = (total_count + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page < total_pages
+    next_after = None
+    if len(users) > per_page:
+        last = users[per_page - 1]
+        if query.isdigit():
+            next_after = last[0]
+        elif query:
+            next_after = f"{last[4]}:{last[0]}"
+        elif college_filter:
+            next_after = f"{last[7]:%Y-%m-%d %H:%M:%S}:{last[0]}"
+        else:
+            next_after = f"{last[3]:%Y-%m-%d %H:%M:%S}:{last[0]}"
     
     return render_template('admin/users.html', 
-                         users=users,
-                         pagination={
-                             'page': page,
-                             'total_pages': total_pages,
-                             'total_count': total_count,
-                             'has_prev': has_prev,
-                             'has_next': has_next
-                         })
+                         users=users[:per_page],
+                         total_users=_user_count_cache.get_or_load('all', _count_users),
+                         colleges=COLLEGES,
+                         identities=IDENTITIES,
+                         query=query,
+                         role_filter=role_filter,
+                         status_filter=status_filter,
+                         college_filter=college_filter,
+                         after=after,
+                         next_after=next_after)
 
 @bp.route('/tags', methods=['GET', 'POST'])
 @admin_required
@@ -124,12 +218,17 @@ def tag_management():
             with get_connection() as conn:
                 with conn.cursor() as cur:
                     try:
+                        conn.begin()
                         cur.execute("""
                             INSERT INTO interest_tag (tag_name, category, is_active)
                             VALUES (%s, %s, 1)
                         """, (tag_name, category))
+                        log_change(cur, 'tag', str(cur.lastrowid), op='insert', actor_id=session.get('user_id'))
+                        conn.commit()
+                        invalidate_tag_catalog()
                         flash(f"Tag '{tag_name}' added successfully!", "success")
                     except Exception as e:
+                        conn.rollback()
                         flash("Failed to add tag", "danger")
         else:
             flash("Tag name and category are required", "danger")
@@ -139,7 +238,7 @@ def tag_management():
     
     tags = []
     
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         with conn.cursor() as cur:
             sql = """
                 SELECT it.tag_id, it.tag_name, it.category, it.is_active, it.created_at,
@@ -165,9 +264,13 @@ def tag_management():
             
             cur.execute(sql, params)
             tags = cur.fetchall()
+            
+            cur.execute("SELECT tag_id, tag_name, category FROM interest_tag ORDER BY category, tag_name")
+            all_tags = cur.fetchall()
     
     return render_template('admin/tags.html', 
                          tags=tags,
+                         all_tags=all_tags,
                          category_filter=category_filter,
                          status_filter=status_filter)
 
@@ -177,7 +280,8 @@ def toggle_tag_status(tag_id):
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
-                cur.execute("SELECT is_active FROM interest_tag WHERE tag_id = %s", (tag_id,))
+                conn.begin()
+                cur.execute("SELECT is_active FROM interest_tag WHERE tag_id = %s FOR UPDATE", (tag_id,))
                 result = cur.fetchone()
                 
                 if result:
@@ -189,25 +293,69 @@ def toggle_tag_status(tag_id):
                         SET is_active = %s, updated_at = NOW()
                         WHERE tag_id = %s
                     """, (new_status, tag_id))
+                    log_change(cur, 'tag', str(tag_id), op='activate' if new_status else 'deactivate',
+                               actor_id=session.get('user_id'))
+                    
+                    conn.commit()
+                    invalidate_tag_catalog()
                     
                     if new_status:
                         flash(f"Tag enabled successfully!", "success")
                     else:
                         flash(f"Tag disabled successfully!", "info")
                 else:
+                    conn.rollback()
                     flash("Tag not found", "danger")
             except Exception as e:
+                conn.rollback()
                 flash("Operation failed", "danger")
     
     return redirect(url_for('admin.tag_management'))
 
+@bp.route('/tags/bulk-status', methods=['POST'])
+@admin_required
+def bulk_tag_status():
+    category = request.form.get('category', '')
+    action = request.form.get('action', '')
+    
+    if not category or action not in ('enable', 'disable'):
+        flash("Choose a category and an action", "danger")
+    else:
+        count = set_category_active(category, action == 'enable')
+        if count < 0:
+            flash(f"Could not {action} the {category} tags; nothing was changed", "danger")
+        else:
+            flash(f"{action.capitalize()}d {count} {category} tag(s)", "success")
+    
+    return redirect(url_for('admin.tag_management', category=category or None))
+
+@bp.route('/tags/merge', methods=['POST'])
+@admin_required
+def merge_tag():
+    source_id = request.form.get('source_id', type=int)
+    target_id = request.form.get('target_id', type=int)
+    
+    try:
+        moved = merge_tags(source_id, target_id) if source_id and target_id else None
+    except ValueError:
+        moved = None
+    if moved is None:
+        flash("Choose two different existing tags", "danger")
+    elif moved < 0:
+        flash("Tag merge failed; nothing was changed", "danger")
+    else:
+        flash(f"Tag merged: {moved} student membership(s) moved to the target tag", "success")
+    
+    return redirect(url_for('admin.tag_management'))
+
 @bp.route('/users/<user_id>/toggle-status', methods=['POST'])
 @admin_required
 def toggle_user_status(user_id):
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
-                cur.execute("SELECT is_active FROM user WHERE user_id = %s", (user_id,))
+                conn.begin()
+                cur.execute("SELECT is_active FROM user WHERE user_id = %s FOR UPDATE", (user_id,))
                 result = cur.fetchone()
                 
                 if result:
@@ -219,18 +367,57 @@ def toggle_user_status(user_id):
                         SET is_active = %s, updated_at = NOW()
                         WHERE user_id = %s
                     """, (new_status, user_id))
+                    cur.execute("""
+                        UPDATE student SET is_active = %s, updated_at = NOW()
+                        WHERE student_id = %s
+                    """, (new_status, user_id))
+                    log_change(cur, 'student', str(user_id), actor_id=session.get('user_id'))
+                    log_change(cur, 'user', str(user_id), op='activate' if new_status else 'deactivate',
+                               actor_id=session.get('user_id'))
+                    
+                    conn.commit()
                     
                     if new_status:
                         flash(f"User {user_id} activated successfully!", "success")
                     else:
                         flash(f"User {user_id} deactivated successfully!", "info")
                 else:
+                    conn.rollback()
                     flash("User not found", "danger")
             except Exception as e:
+                conn.rollback()
                 flash("Operation failed", "danger")
     
     return redirect(url_for('admin.user_management'))
 
+@bp.route('/users/bulk-status', methods=['POST'])
+@admin_required
+def bulk_user_status():
+    action = request.form.get('action', '')
+    user_ids = [u for u in re.split(r'[\s,;]+', request.form.get('user_ids', '')) if u]
+    filters = {
+        'college': request.form.get('college', ''),
+        'year_of_study': request.form.get('year_of_study', type=int),
+        'identity': request.form.get('identity', ''),
+        'id_prefix': request.form.get('id_prefix', '').strip(),
+    }
+    
+    if action not in ('activate', 'deactivate'):
+        flash("Invalid action", "danger")
+    elif filters['id_prefix'] and not filters['id_prefix'].isdigit():
+        flash("Student ID prefix must be digits", "danger")
+    elif not user_ids and not any(filters.values()):
+        flash("Enter user IDs or at least one filter", "warning")
+    else:
+        count = set_users_active(action == 'activate', user_ids=user_ids or None, filters=filters)
+        if count < 0:
+            flash(f"Bulk {action} failed part way; some accounts may already be changed. "
+                  f"Run it again to finish", "danger")
+        else:
+            flash(f"{action.capitalize()}d {count} student account(s)", "success")
+    
+    return redirect(url_for('admin.user_management'))
+
 @bp.route('/users/<user_id>/edit', methods=['GET', 'POST'])
 @admin_required
 def edit_user(user_id):
@@ -261,6 +448,7 @@ def edit_user(user_id):
         with get_connection() as conn:
             with conn.cursor() as cur:
                 try:
+                    conn.begin()
                     cur.execute("""
                         UPDATE user 
                         SET role = %s, updated_at = NOW()
@@ -274,9 +462,12 @@ def edit_user(user_id):
                                 email = %s, wechat_id = %s, bio = %s, updated_at = NOW()
                             WHERE student_id = %s
                         """, (new_name, new_college, new_major, new_email, new_wechat, new_bio, user_id))
+                        log_change(cur, 'student', str(user_id), actor_id=session.get('user_id'))
+                    conn.commit()
                     
                     flash(f"User {user_id} updated successfully!", "success")
                 except Exception as e:
+                    conn.rollback()
                     flash("Update failed", "danger")
         
         return redirect(url_for('admin.user_management'))
@@ -286,58 +477,188 @@ def edit_user(user_id):
 @bp.route('/reports')
 @admin_required
 def report_management():
+    per_page = 20
+    reported_filter = request.args.get('reported_id', '').strip()
+    status_filter = request.args.get('status', '')
+    before_id = request.args.get('before', type=int)
+    
     reports = []
     
-    with get_connection() as conn:
+    with get_read_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT r.*, 
+            sql = """
+                SELECT r.id, r.reporter_id, r.reported_id, r.reason, r.description,
                        s1.name as reporter_name, s1.nickname as reporter_nickname,
-                       s2.name as reported_name, s2.nickname as reported_nickname
-                FROM reports r
+                       s2.name as reported_name, s2.nickname as reported_nickname,
+                       r.status, r.created_at, r.resolved_at
+                FROM {table} r
                 JOIN student s1 ON r.reporter_id = s1.student_id
                 JOIN student s2 ON r.reported_id = s2.student_id
-                ORDER BY r.created_at DESC
-            """)
+                WHERE 1=1
+            """
+            params = []
+            
+            if reported_filter:
+                sql += " AND r.reported_id = %s"
+                params.append(reported_filter)
+            if status_filter:
+                sql += " AND r.status = %s"
+                params.append(status_filter)
+            if before_id:
+                sql += " AND r.id < %s"
+                params.append(before_id)
+            
+            # resolved reports may have been moved to reports_archive
+            sql, params = union_with_archive('reports', sql, params, "id DESC",
+                                             limit=per_page + 1, status=status_filter)
+            cur.execute(sql, params)
             reports = cur.fetchall()
     
-    return render_template('admin/reports.html', reports=reports)
+    next_before = reports[per_page - 1][0] if len(reports) > per_page else None
+    
+    return render_template('admin/reports.html',
+                         reports=reports[:per_page],
+                         reported_filter=reported_filter,
+                         status_filter=status_filter,
+                         next_before=next_before)
+
+@bp.route('/reports/queue')
+@admin_required
+def moderation_queue():
+    per_page = 20
+    before = None
+    cursor = request.args.get('before', '')
+    if cursor:
+        try:
+            priority, reported_id = cursor.split(':', 1)
+            before = (float(priority), reported_id)
+        except ValueError:
+            before = None
+    
+    queue = get_report_queue(before=before, limit=per_page + 1)
+    next_cursor = None
+    if len(queue) > per_page:
+        last = queue[per_page - 1]
+        next_cursor = f"{last.priority!r}:{last.reported_id}"
+    
+    return render_template('admin/moderation_queue.html',
+                         queue=queue[:per_page],
+                         next_cursor=next_cursor)
+
+@bp.route('/reports/queue/bulk', methods=['POST'])
+@admin_required
+def bulk_report_action():
+    reported_ids = request.form.getlist('reported_ids')
+    action = request.form.get('action', '')
+    
+    if not reported_ids:
+        flash("No users selected", "warning")
+    elif action == 'resolve':
+        count = resolve_reports_for(reported_ids)
+        flash(f"Resolved {count} report(s) for {len(reported_ids)} user(s)", "success")
+    elif action == 'delete':
+        count = delete_reports_for(reported_ids)
+        flash(f"Deleted {count} report(s) for {len(reported_ids)} user(s)", "success")
+    else:
+        flash("Invalid action", "danger")
+    
+    return redirect(url_for('admin.moderation_queue'))
 
 @bp.route('/reports/<int:report_id>/resolve', methods=['POST'])
 @admin_required
 def resolve_report(report_id):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute("""
-                    UPDATE reports 
-                    SET status = 'resolved', resolved_at = NOW()
-                    WHERE id = %s
-                """, (report_id,))
-                
-                if cur.rowcount > 0:
-                    flash("Report marked as resolved successfully!", "success")
-                else:
-                    flash("Report not found", "danger")
-            except Exception as e:
-                flash("Operation failed", "danger")
+    if update_report(report_id, 'resolve'):
+        flash("Report marked as resolved successfully!", "success")
+    else:
+        flash("Report not found", "danger")
     
-    return redirect(url_for('admin.report_management'))
+    return redirect(url_for('admin.report_management',
+                            reported_id=request.form.get('reported_id') or None))
 
 @bp.route('/reports/<int:report_id>/delete', methods=['POST'])
 @admin_required
 def delete_report(report_id):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute("DELETE FROM reports WHERE id = %s", (report_id,))
-                
-                if cur.rowcount > 0:
-                    flash("Report deleted successfully!", "success")
-                else:
-                    flash("Report not found", "danger")
-            except Exception as e:
-                flash("Operation failed", "danger")
+    if update_report(report_id, 'delete'):
+        flash("Report deleted successfully!", "success")
+    else:
+        flash("Report not found", "danger")
+    
+    return redirect(url_for('admin.report_management',
+                            reported_id=request.form.get('reported_id') or None))
+
+@bp.route('/profiler', methods=['GET', 'POST'])
+@admin_required
+def profiler_control():
+    if request.method == 'POST':
+        action = request.form.get('action', '')
+        if action == 'start':
+            endpoints = request.form.getlist('endpoints')
+            rate = request.form.get('rate', 0.1, type=float)
+            interval_ms = request.form.get('interval_ms', 5, type=float)
+            if not endpoints:
+                flash("Select at least one route to profile", "danger")
+            else:
+                profiler.start(endpoints, rate, interval_ms / 1000)
+                flash(f"Profiling {len(profiler.endpoints)} route(s) at {profiler.rate:.0%} of requests in every worker", "success")
+        elif action == 'stop':
+            profiler.stop()
+            flash("Profiler stopped in every worker", "info")
+        elif action == 'reset':
+            profiler.clear()
+            flash("Samples cleared", "info")
+        return redirect(url_for('admin.profiler_control'))
+    
+    profiler.sync(force=True)
+    _, profiled_requests, samples, workers = profiler.totals()
+    endpoints = sorted(ep for ep in current_app.view_functions if ep != 'static')
+    return render_template('admin/profiler.html', profiler=profiler, endpoints=endpoints,
+                           profiled_requests=profiled_requests, samples=samples, workers=workers)
+
+@bp.route('/profiler/download')
+@admin_required
+def profiler_download():
+    return Response(profiler.collapsed(), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=profile.collapsed'})
+
+# error reports of recent imports, downloadable for an hour
+_import_reports = TTLCache('import_reports', ttl=3600, maxsize=20)
+
+@bp.route('/import', methods=['GET', 'POST'])
+@admin_required
+def cohort_import():
+    result = None
+    report_token = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Choose a CSV file to import", "danger")
+            return redirect(url_for('admin.cohort_import'))
+        
+        default_password = request.form.get('default_password', '') or None
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        # counted before importing anything, so an oversized file is not half imported
+        rows = sum(1 for _ in csv.reader(stream)) - 1
+        if rows > IMPORT_WEB_MAX_ROWS:
+            flash(f"This file has {rows} rows; uploads take at most {IMPORT_WEB_MAX_ROWS}. "
+                  f"Import it on the server with python -m jobs.import_cohort", "danger")
+            return redirect(url_for('admin.cohort_import'))
+        stream.seek(0)
+        result = import_cohort(stream, default_password=default_password)
+        if result.errors:
+            report_token = secrets.token_urlsafe(16)
+            _import_reports.set(report_token, result.errors_csv())
+        flash(f"Imported {result.imported} account(s) in {result.seconds}s, {len(result.errors)} row(s) rejected",
+              "success" if not result.errors else "warning")
     
-    return redirect(url_for('admin.report_management'))
+    return render_template('admin/import.html', result=result, report_token=report_token,
+                           max_rows=IMPORT_WEB_MAX_ROWS)
 
+@bp.route('/import/<token>/errors.csv')
+@admin_required
+def cohort_import_errors(token):
+    report = _import_reports.get(token)
+    if report is None:
+        flash("That error report has expired", "danger")
+        return redirect(url_for('admin.cohort_import'))
+    return Response(report, mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=import_errors.csv'})
@@ -1,7 +1,11 @@
 # pages/login.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from dal import get_connection, authenticate_user
+from dal import get_connection, authenticate_user, refresh_student_facets, get_active_tags
 import bcrypt
+from metrics import time_bcrypt
+from config import BCRYPT_ROUNDS
+from ratelimit import rate_limit
+from changefeed import log_change
 
 bp = Blueprint('login', __name__)
 
@@ -36,11 +40,13 @@ def register():
                     flash("Student ID already exists", "danger")
                     return redirect(url_for('login.register'))
         
-        hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+        with time_bcrypt('hash'):
+            hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
         
         with get_connection() as conn:
             with conn.cursor() as cur:
                 try:
+                    conn.begin()
                     cur.execute("""
                         INSERT INTO user (user_id, password_hash, role, is_active)
                         VALUES (%s, %s, 'student', 1)
@@ -72,39 +78,30 @@ def register():
                                 INSERT INTO student_interest (student_id, tag_id, created_at)
                                 VALUES (%s, %s, NOW())
                             """, (student_id, tag_id))
+                    log_change(cur, 'student', student_id, op='insert')
+                    conn.commit()
+                    refresh_student_facets(student_id)
                     
                     flash("Registration successful! Please log in.", "success")
                     return redirect(url_for('login.login_form'))
                     
                 except Exception as e:
+                    conn.rollback()
                     flash(f"Registration failed: {str(e)}", "danger")
                     return redirect(url_for('login.register'))
     
-    all_tags = []
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT tag_id, tag_name, category FROM interest_tag WHERE is_active = 1 ORDER BY category, tag_name")
-            raw_tags = cur.fetchall()
-            all_tags = [
-                {
-                    'tag_id': tag[0],      # tag_id
-                    'tag_name': tag[1],    # tag_name  
-                    'category': tag[2]     # category
-                }
-                for tag in raw_tags
-            ]
+    all_tags = get_active_tags()
     
     return render_template('register.html', all_tags=all_tags)
 
 
 @bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('login')
 def login_form():
     if request.method == 'POST':
         student_id = request.form.get('student_id', '').strip() or request.form.get('user_id', '').strip()
         password = request.form.get('password', '')
         
-        print(f"DEBUG: Attempting login with student_id: {student_id}")
-        
         user = authenticate_user(student_id, password)
         if user:
             session['user_id'] = user['user_id']
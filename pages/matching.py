@@ -1,7 +1,11 @@
 # pages/matching.py
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from dal import get_connection, get_student, get_student_interests, send_invitation, send_report, get_invitations, get_received_invitations, get_like_status, toggle_like, get_like_count
-import pymysql
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, Response
+from dal import get_student, search_students, get_student_interests, send_invitation, send_report, get_invitations, get_received_invitations, respond_to_invitation, get_like_status, toggle_like, get_like_count, get_search_facets, get_search_exclusions
+from datetime import datetime
+from notify import broker
+from config import SSE_HEARTBEAT_SECONDS
+from ratelimit import rate_limit
+import json
 
 bp = Blueprint('matching', __name__, url_prefix='/matching')
 
@@ -15,122 +19,37 @@ def search_matches():
     hometown = request.args.get('hometown', '')
     mbti = request.args.get('mbti', '')
     gender = request.args.get('gender', '')
+    show_handled = request.args.get('show_handled', '')
     
     page = request.args.get('page', 1, type=int)
     per_page = 5
     offset = (page - 1) * per_page
     
-    students = []
-    total_count = 0
-    
-    with get_connection() as conn:
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            count_sql = """
-                SELECT COUNT(DISTINCT s.student_id) as total
-                FROM student s
-            """
-            count_params = []
-            
-            if mbti:
-                count_sql += """
-                    JOIN student_interest si ON s.student_id = si.student_id
-                    JOIN interest_tag it ON si.tag_id = it.tag_id
-                """
-            
-            count_sql += " WHERE s.is_active = 1 AND s.student_id != %s"
-            count_params.append(session['user_id'])
-            
-            if college:
-                count_sql += " AND s.college = %s"
-                count_params.append(college)
-            if identity:
-                count_sql += " AND s.identity = %s"
-                count_params.append(identity)
-            if major:
-                count_sql += " AND s.major = %s"
-                count_params.append(major)
-            if hometown:
-                count_sql += " AND s.hometown = %s"
-                count_params.append(hometown)
-            if gender:
-                count_sql += " AND s.gender = %s"
-                count_params.append(gender)
-            if mbti:
-                count_sql += " AND it.tag_name = %s AND it.category = 'MBTI'"
-                count_params.append(mbti)
-            
-            if age_min:
-                count_sql += " AND (YEAR(CURDATE()) - YEAR(s.birth_date)) >= %s"
-                count_params.append(age_min)
-            if age_max:
-                count_sql += " AND (YEAR(CURDATE()) - YEAR(s.birth_date)) <= %s"
-                count_params.append(age_max)
-            
-            cur.execute(count_sql, count_params)
-            total_count = cur.fetchone()['total']
-            
-            sql = """
-                SELECT s.*
-                FROM student s
-            """
-            
-            if mbti:
-                sql += """
-                    JOIN student_interest si ON s.student_id = si.student_id
-                    JOIN interest_tag it ON si.tag_id = it.tag_id
-                """
-            
-            sql += " WHERE s.is_active = 1 AND s.student_id != %s"
-            params = [session['user_id']]
-            
-            if college:
-                sql += " AND s.college = %s"
-                params.append(college)
-            if identity:
-                sql += " AND s.identity = %s"
-                params.append(identity)
-            if major:
-                sql += " AND s.major = %s"
-                params.append(major)
-            if hometown:
-                sql += " AND s.hometown = %s"
-                params.append(hometown)
-            if gender:
-                sql += " AND s.gender = %s"
-                params.append(gender)
-            if mbti:
-                sql += " AND it.tag_name = %s AND it.category = 'MBTI'"
-                params.append(mbti)
-            
-            if age_min:
-                sql += " AND (YEAR(CURDATE()) - YEAR(s.birth_date)) >= %s"
-                params.append(age_min)
-            if age_max:
-                sql += " AND (YEAR(CURDATE()) - YEAR(s.birth_date)) <= %s"
-                params.append(age_max)
-            
-            sql += " ORDER BY s.updated_at DESC LIMIT %s OFFSET %s"
-            params.extend([per_page, offset])
-            
-            cur.execute(sql, params)
-            students = cur.fetchall()
+    filters = {
+        'college': college,
+        'identity': identity,
+        'age_min': age_min,
+        'age_max': age_max,
+        'major': major,
+        'hometown': hometown,
+        'mbti': mbti,
+        'gender': gender,
+        'show_handled': show_handled
+    }
+    # students already liked, invited or reported are hidden unless asked for
+    hidden = None if show_handled else get_search_exclusions(session['user_id'])
+    students, total_count = search_students(filters, session['user_id'], per_page, offset, hidden=hidden)
     
     total_pages = (total_count + per_page - 1) // per_page
     has_prev = page > 1
     has_next = page < total_pages
     
+    facets = get_search_facets(filters, exclude_id=session['user_id'], hidden=hidden)
+    
     return render_template('matching/search.html', 
                          students=students,
-                         filters={
-                             'college': college,
-                             'identity': identity,
-                             'age_min': age_min,
-                             'age_max': age_max,
-                             'major': major,
-                             'hometown': hometown,
-                             'mbti': mbti,
-                             'gender': gender
-                         },
+                         filters=filters,
+                         facets=facets,
                          pagination={
                              'page': page,
                              'total_pages': total_pages,
@@ -154,6 +73,7 @@ def student_detail(student_id):
                          like_count=like_count)
 
 @bp.route('/like/<target_id>', methods=['POST'])
+@rate_limit('like')
 def like_student(target_id):
     current_user_id = session.get('user_id')
     if not current_user_id:
@@ -177,6 +97,7 @@ def like_student(target_id):
     return redirect(url_for('matching.student_detail', student_id=target_id))
 
 @bp.route('/invite/<target_id>', methods=['POST'])
+@rate_limit('invite')
 def send_invitation_to(target_id):
     current_user_id = session.get('user_id')
     if not current_user_id:
@@ -195,19 +116,48 @@ def send_invitation_to(target_id):
     
     return redirect(url_for('matching.student_detail', student_id=target_id))
 
+def _parse_cursor(value: str):
+    """Decode a ``<YYYYmmddHHMMSS>.<id>`` keyset cursor from the query string."""
+    if not value:
+        return None
+    try:
+        stamp, inv_id = value.split('.')
+        return datetime.strptime(stamp, '%Y%m%d%H%M%S'), int(inv_id)
+    except ValueError:
+        return None
+
+def _next_cursor(rows, per_page):
+    if len(rows) <= per_page:
+        return None
+    last = rows[per_page - 1]
+    return f"{last.created_at:%Y%m%d%H%M%S}.{last.id}"
+
 @bp.route('/history')
 def invitation_history():
     current_user_id = session.get('user_id')
     if not current_user_id:
         return redirect(url_for('login.login_form'))
     
-    sent_invitations = get_invitations(current_user_id)
+    per_page = 10
+    sent_before = request.args.get('sent_before', '')
+    received_before = request.args.get('received_before', '')
+    
+    # one extra row tells us whether an older page exists
+    sent_invitations = get_invitations(current_user_id, before=_parse_cursor(sent_before),
+                                       limit=per_page + 1)
     
-    received_invitations = get_received_invitations(current_user_id)
+    received_invitations = get_received_invitations(current_user_id, before=_parse_cursor(received_before),
+                                                    limit=per_page + 1)
     
     return render_template('matching/history.html',
-                         sent_invitations=sent_invitations,
-                         received_invitations=received_invitations)
+                         sent_invitations=sent_invitations[:per_page],
+                         received_invitations=received_invitations[:per_page],
+                         cursors={
+                             'sent_before': sent_before,
+                             'received_before': received_before,
+                             'sent_next': _next_cursor(sent_invitations, per_page),
+                             'received_next': _next_cursor(received_invitations, per_page)
+                         })
 
 @bp.route('/respond-invitation/<int:invitation_id>/<response>', methods=['GET'])
 def respond_invitation(invitation_id: int, response: str):
@@ -220,40 +170,46 @@ def respond_invitation(invitation_id: int, response: str):
         flash("Invalid response", "danger")
         return redirect(url_for('matching.invitation_history'))
     
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT * FROM invitations 
-                WHERE id = %s AND to_student_id = %s AND status = 'pending'
-            """, (invitation_id, current_user_id))
-            invitation = cur.fetchone()
-            
-            if not invitation:
-                flash("Invitation not found or already responded", "danger")
-                return redirect(url_for('matching.invitation_history'))
-    
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute("""
-                    UPDATE invitations
-                    SET status = %s, updated_at = NOW()
-                    WHERE id = %s AND to_student_id = %s
-                """, (response, invitation_id, current_user_id))
-                
-                if cur.rowcount > 0:
-                    if response == 'accepted':
-                        flash("Invitation accepted successfully!", "success")
-                    else:
-                        flash("Invitation rejected successfully!", "info")
-                else:
-                    flash("Failed to update invitation", "danger")
-            except Exception as e:
-                flash("Operation failed", "danger")
+    if respond_to_invitation(invitation_id, response, to_id=current_user_id):
+        if response == 'accepted':
+            flash("Invitation accepted successfully!", "success")
+        else:
+            flash("Invitation rejected successfully!", "info")
+    else:
+        flash("Invitation not found or already responded", "danger")
     
     return redirect(url_for('matching.invitation_history'))
 
+@bp.route('/events')
+def events():
+    """Server-sent events for new invitations, responses and likes."""
+    current_user_id = session.get('user_id')
+    if not current_user_id:
+        # 204 tells EventSource to stop reconnecting
+        return Response(status=204)
+    
+    sub = broker.subscribe(current_user_id)
+    if sub is None:
+        return Response("Too many open event streams", status=503, headers={'Retry-After': '30'})
+    
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                messages = sub.wait(SSE_HEARTBEAT_SECONDS)
+                if not messages:
+                    # keeps proxies from closing the connection and detects gone clients
+                    yield ": ping\n\n"
+                for event, data in messages:
+                    yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            broker.unsubscribe(sub)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @bp.route('/report/<target_id>', methods=['POST'])
+@rate_limit('report')
 def report_student(target_id):
     current_user_id = session.get('user_id')
     if not current_user_id:
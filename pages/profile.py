@@ -1,8 +1,11 @@
 # pages/profile.py
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from dal import get_student, get_student_interests, get_connection
+from dal import get_student, get_student_interests, get_connection, refresh_student_facets
 import bcrypt
+from metrics import time_bcrypt
+from config import BCRYPT_ROUNDS
 from dal import authenticate_user
+from changefeed import log_change
 
 bp = Blueprint('profile', __name__, url_prefix='/user')
 
@@ -49,6 +52,7 @@ def edit_profile(student_id):
         
         with get_connection() as conn:
             with conn.cursor() as cur:
+                conn.begin()
                 sql = """
                     UPDATE student 
                     SET nickname = %s, gender = %s, college = %s, major = %s, 
@@ -69,6 +73,9 @@ def edit_profile(student_id):
                     student_id
                 ]
                 cur.execute(sql, params)
+                log_change(cur, 'student', student_id, actor_id=session.get('user_id'))
+                conn.commit()
+        refresh_student_facets(student_id)
         
         flash("Profile updated successfully!", "success")
         return redirect(url_for('profile.edit_profile', student_id=student_id))
@@ -99,7 +106,8 @@ def change_password(student_id):
             flash("Passwords do not match", "danger")
             return redirect(url_for('profile.change_password', student_id=student_id))
         
-        hashed_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt())
+        with time_bcrypt('hash'):
+            hashed_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
         with get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
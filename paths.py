@@ -0,0 +1,24 @@
+# paths.py
+"""Private on-disk directories for caches that the app loads code or data from."""
+import os
+import stat
+
+
+def private_dir(path: str) -> str:
+    """Create ``path`` with mode 0700, or check that an existing one is ours and private.
+
+    Compiled templates and profile snapshots are trusted when read back, so a
+    directory another local user can write to would let them plant either.
+    Raises RuntimeError if the directory belongs to someone else or is group
+    or world writable.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise RuntimeError(f"{path} is not a directory")
+    if hasattr(os, 'getuid'):  # POSIX only; Windows relies on the profile directory ACLs
+        if st.st_uid != os.getuid():
+            raise RuntimeError(f"{path} is owned by another user; refusing to use it")
+        if st.st_mode & 0o022:
+            raise RuntimeError(f"{path} is writable by other users; refusing to use it")
+    return path
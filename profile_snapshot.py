@@ -0,0 +1,540 @@
+# profile_snapshot.py
+"""Memory-mapped, column-oriented snapshot of active students for search.
+
+``python -m jobs.build_profile_snapshot`` exports every active student's card
+fields, filter attributes and interest tags into ``profiles-<built_at>.snap``
+in PROFILE_SNAPSHOT_DIR, then points the ``CURRENT`` file at it with an atomic
+rename. Workers map the file read-only, so every process on a host shares one
+copy in the page cache, and search_students answers from it without MySQL.
+
+Layout (little-endian): a header, a section table, then 8-byte aligned
+sections, each a flat array read in place through a memoryview cast. Rows are
+stored in search order (updated_at DESC).
+
+- ``student_id``: CHAR(8) ids, 8 bytes each; ``id_order``: rows sorted by id
+- ``year_of_study``, ``birth_year`` (0 = unknown), and the rows born in each
+  year of ``birth_year.keys`` (``birth_year.poff`` / ``birth_year.post``)
+- ``name``, ``nickname``, ``bio``: string columns, ``.off`` offsets into ``.str``
+- ``college``, ``identity``, ``gender``, ``major``, ``hometown``: a code per row
+  into the ``.dict`` strings (code 0 = NULL), and the rows holding each code
+  (``.poff`` offsets into ``.post``)
+- ``tag.name``, ``tag.category``: every interest tag, and the rows holding each
+  (``tag.poff`` / ``tag.post``)
+
+Changes after the build arrive through the change feed: each changed student
+is re-read into a small in-memory overlay that hides their snapshot row and is
+searched alongside it. A newer snapshot is swapped in with one assignment
+(searches already running finish on the old mapping), and overlay entries it
+already covers are dropped. Search falls back to SQL while there is no
+snapshot, when it is older than PROFILE_SNAPSHOT_MAX_AGE, and after a bulk
+change (e.g. a cohort import) until a snapshot built after it is loaded.
+"""
+import bisect
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import date
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from paths import private_dir
+from rows import StudentCard
+
+MAGIC = b'CMSNAP01'
+_HEADER = struct.Struct('<8sdII')     # magic, built_at, rows, sections
+_SECTION = struct.Struct('<24sQQ')    # name, offset, length
+CURRENT = 'CURRENT'
+
+TEXT_COLUMNS = ('name', 'nickname', 'bio')
+DICT_COLUMNS = ('college', 'identity', 'gender', 'major', 'hometown')
+
+# changes logged up to this many seconds before a build may still be missing from it
+CATCH_UP_MARGIN = 60
+
+# the columns of SnapshotRow, in order
+SNAPSHOT_COLUMNS = ("s.student_id, s.name, s.nickname, s.college, s.year_of_study, s.major, "
+                    "LEFT(s.bio, 200), s.identity, s.gender, s.hometown, YEAR(s.birth_date)")
+
+
+class SnapshotRow(NamedTuple):
+    student_id: str
+    name: str
+    nickname: Optional[str]
+    college: str
+    year_of_study: int
+    major: str
+    bio: Optional[str]
+    identity: Optional[str]
+    gender: str
+    hometown: Optional[str]
+    birth_year: Optional[int]
+
+
+# Writing
+# -------
+
+def _strings(values: Iterable[Optional[str]]) -> Tuple[array, bytes]:
+    offsets = array('I', [0])
+    data = bytearray()
+    for value in values:
+        data += (value or '').encode()
+        offsets.append(len(data))
+    return offsets, bytes(data)
+
+
+def _contains(rows, row: int) -> bool:
+    """Whether ``row`` is in the sorted posting list ``rows``."""
+    i = bisect.bisect_left(rows, row)
+    return i < len(rows) and rows[i] == row
+
+
+def _postings(lists: List[array]) -> Tuple[array, array]:
+    offsets = array('I', [0])
+    flat = array('I')
+    for rows in lists:
+        flat.extend(rows)
+        offsets.append(len(flat))
+    return offsets, flat
+
+
+def write_snapshot(path: str, built_at: float, rows: List[SnapshotRow],
+                   tags: List[Tuple[str, str]], tag_rows: List[array]) -> None:
+    """Write ``rows`` (in search order) and, per entry of ``tags``, the sorted rows holding it."""
+    sections = []
+
+    def add(name, data):
+        sections.append((name, bytes(data)))
+
+    add('student_id', b''.join(r.student_id.encode().ljust(8) for r in rows))
+    add('id_order', array('I', sorted(range(len(rows)), key=lambda i: rows[i].student_id)))
+    add('year_of_study', array('B', (r.year_of_study for r in rows)))
+    add('birth_year', array('H', (r.birth_year or 0 for r in rows)))
+    years = sorted({r.birth_year for r in rows} - {None})
+    by_year = {year: array('I') for year in years}
+    for row, r in enumerate(rows):
+        if r.birth_year is not None:
+            by_year[r.birth_year].append(row)
+    add('birth_year.keys', array('H', years))
+    offsets, flat = _postings(list(by_year.values()))
+    add('birth_year.poff', offsets)
+    add('birth_year.post', flat)
+    for col in TEXT_COLUMNS:
+        offsets, data = _strings(getattr(r, col) for r in rows)
+        add(col + '.off', offsets)
+        add(col + '.str', data)
+    for col in DICT_COLUMNS:
+        values = [None] + sorted({getattr(r, col) for r in rows} - {None})
+        code_of = {value: code for code, value in enumerate(values)}
+        codes = array('H' if len(values) <= 0x10000 else 'I', (code_of[getattr(r, col)] for r in rows))
+        by_code = [array('I') for _ in values]
+        for row, code in enumerate(codes):
+            by_code[code].append(row)
+        add(col, codes)
+        offsets, data = _strings(values)
+        add(col + '.dict.off', offsets)
+        add(col + '.dict.str', data)
+        offsets, flat = _postings(by_code)
+        add(col + '.poff', offsets)
+        add(col + '.post', flat)
+    for i, col in enumerate(('tag.name', 'tag.category')):
+        offsets, data = _strings(tag[i] for tag in tags)
+        add(col + '.off', offsets)
+        add(col + '.str', data)
+    offsets, flat = _postings(tag_rows)
+    add('tag.poff', offsets)
+    add('tag.post', flat)
+
+    position = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    for name, data in sections:
+        position += -position % 8
+        table.append(_SECTION.pack(name.encode(), position, len(data)))
+        position += len(data)
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, built_at, len(rows), len(sections)))
+        f.write(b''.join(table))
+        for name, data in sections:
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def publish_snapshot(directory: str, built_at: float, rows: List[SnapshotRow],
+                     tags: List[Tuple[str, str]], tag_rows: List[array], keep: int = 3) -> str:
+    """Write a new version, make it CURRENT and delete all but the newest ``keep`` versions."""
+    private_dir(directory)
+    name = f"profiles-{int(built_at * 1000)}.snap"
+    path = os.path.join(directory, name)
+    write_snapshot(path + '.tmp', built_at, rows, tags, tag_rows)
+    os.replace(path + '.tmp', path)
+
+    pointer = os.path.join(directory, CURRENT)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+
+    versions = sorted(n for n in os.listdir(directory) if n.startswith('profiles-') and n.endswith('.snap'))
+    for old in versions[:-keep]:
+        try:
+            # workers still mapping it keep reading the unlinked file until they swap
+            os.remove(os.path.join(directory, old))
+        except OSError as e:
+            print(f"[SNAPSHOT ERROR] could not remove {old}: {e}")
+    return path
+
+
+# Reading
+# -------
+
+class _Strings:
+    __slots__ = ('_offsets', '_data')
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        return str(self._data[self._offsets[i]:self._offsets[i + 1]], 'utf-8') or None
+
+
+class Snapshot:
+    """One mapped snapshot file. Read-only and safe to share between threads."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, self.built_at, self.rows, count = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a profile snapshot")
+        self.path = path
+        self._sections = {}
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+            self._sections[name.rstrip(b'\0').decode()] = view[offset:offset + length]
+            if name.rstrip(b'\0') == b'student_id':
+                self._ids_at = offset
+        self._id_order = self._array('id_order', 'I')
+        self._year = self._array('year_of_study', 'B')
+        self._birth_year = self._array('birth_year', 'H')
+        self._year_code = {year: code for code, year in enumerate(self._array('birth_year.keys', 'H'))}
+        self._year_postings = (self._array('birth_year.poff', 'I'), self._array('birth_year.post', 'I'))
+        self._text = {col: self._strings(col) for col in TEXT_COLUMNS}
+        self._values = {}
+        self._code_of = {}
+        self._codes = {}
+        self._postings = {}
+        for col in DICT_COLUMNS:
+            values = self._strings(col + '.dict')
+            self._values[col] = [values[code] for code in range(len(values))]
+            self._code_of[col] = {value: code for code, value in enumerate(self._values[col]) if code}
+            self._codes[col] = self._array(col, 'H' if len(values) <= 0x10000 else 'I')
+            self._postings[col] = (self._array(col + '.poff', 'I'), self._array(col + '.post', 'I'))
+        names, categories = self._strings('tag.name'), self._strings('tag.category')
+        self._tag_of = {(names[i], categories[i]): i for i in range(len(names))}
+        self._tag_postings = (self._array('tag.poff', 'I'), self._array('tag.post', 'I'))
+
+    def _array(self, name: str, fmt: str) -> memoryview:
+        return self._sections[name].cast(fmt)
+
+    def _strings(self, name: str) -> _Strings:
+        return _Strings(self._array(name + '.off', 'I'), self._sections[name + '.str'])
+
+    def _id_bytes(self, row: int) -> bytes:
+        start = self._ids_at + row * 8
+        return self._mmap[start:start + 8]
+
+    def student_id(self, row: int) -> str:
+        return self._id_bytes(row).decode('ascii').rstrip()
+
+    def row_of(self, student_id: str) -> Optional[int]:
+        key = student_id.encode().ljust(8)
+        lo, hi = 0, len(self._id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = self._id_order[mid]
+            if self._id_bytes(row) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._id_order):
+            row = self._id_order[lo]
+            if self._id_bytes(row) == key:
+                return row
+        return None
+
+    def card(self, row: int) -> StudentCard:
+        return StudentCard(self.student_id(row), self._text['name'][row], self._text['nickname'][row],
+                           self._values['college'][self._codes['college'][row]], self._year[row],
+                           self._values['major'][self._codes['major'][row]], self._text['bio'][row])
+
+    def _posting(self, postings: Tuple[memoryview, memoryview], code: int) -> memoryview:
+        offsets, flat = postings
+        return flat[offsets[code]:offsets[code + 1]]
+
+    def search(self, filters: Dict, exclude: Iterable[str], limit: int,
+               offset: int) -> Tuple[List[StudentCard], int]:
+        """One page of rows matching ``filters`` and the total, leaving out the ``exclude`` ids."""
+        checks = []
+        postings = []
+        for col in DICT_COLUMNS:
+            value = filters.get(col)
+            if value:
+                code = self._code_of[col].get(value)
+                if code is None:
+                    return [], 0
+                checks.append((self._codes[col], code))
+                postings.append(self._posting(self._postings[col], code))
+        tag_rows = None
+        if filters.get('mbti'):
+            tag = self._tag_of.get((filters['mbti'], 'MBTI'))
+            if tag is None:
+                return [], 0
+            tag_rows = self._posting(self._tag_postings, tag)
+            postings.append(tag_rows)
+        age_min, age_max = filters.get('age_min'), filters.get('age_max')
+        this_year = date.today().year
+        birth_year = self._birth_year
+
+        sources = [(len(rows), rows) for rows in postings]
+        if age_min or age_max:
+            # born in [this_year - age_max, this_year - age_min], one posting list per year
+            first = this_year - age_max if age_max else 0
+            last = this_year - age_min if age_min else 0xFFFF
+            by_year = [self._posting(self._year_postings, code) for year, code in self._year_code.items()
+                       if first <= year <= last]
+            sources.append((sum(map(len, by_year)), by_year))
+
+        # Walk the smallest source (or every row) and check the other filters per row.
+        size, driver = min(sources, key=lambda source: source[0]) if sources else (self.rows, range(self.rows))
+        if isinstance(driver, list):
+            driver = heapq.merge(*driver)
+        tag_set = set(tag_rows) if tag_rows is not None and driver is not tag_rows else None
+
+        def matches(row: int) -> bool:
+            for codes, code in checks:
+                if codes[row] != code:
+                    return False
+            if tag_set is not None and row not in tag_set:
+                return False
+            if age_min or age_max:
+                born = birth_year[row]
+                if not born:
+                    return False
+                if age_min and this_year - born < age_min:
+                    return False
+                if age_max and this_year - born > age_max:
+                    return False
+            return True
+
+        skip = {row for row in map(self.row_of, exclude) if row is not None}
+        total = None
+        if len(sources) <= 1:
+            # every driver row matches, so the total needs no scan; matches() leaves
+            # out the tag check when the tag posting drives, so look skipped rows up in it
+            in_driver = (lambda row: _contains(tag_rows, row)) if driver is tag_rows else (lambda row: True)
+            total = size - sum(1 for row in skip if in_driver(row) and matches(row))
+
+        page = []
+        position = 0
+        for row in driver:
+            if row in skip or not matches(row):
+                continue
+            if position >= offset:
+                if len(page) < limit:
+                    page.append(row)
+                elif total is not None:
+                    break
+            position += 1
+        if total is None:
+            total = position
+        return [self.card(row) for row in page], total
+
+
+# Overlay and version swapping
+# ----------------------------
+
+class OverlayRow(NamedTuple):
+    card: Optional[StudentCard]   # None once the student is inactive or deleted
+    attrs: Dict[str, Optional[str]]
+    birth_year: Optional[int]
+    tags: FrozenSet[Tuple[str, str]]
+    updated_at: float
+    seen_at: float                # database time just after the row was read
+
+    def matches(self, filters: Dict, this_year: int) -> bool:
+        if self.card is None:
+            return False
+        for col in DICT_COLUMNS:
+            value = filters.get(col)
+            if value and self.attrs[col] != value:
+                return False
+        if filters.get('mbti') and (filters['mbti'], 'MBTI') not in self.tags:
+            return False
+        age_min, age_max = filters.get('age_min'), filters.get('age_max')
+        if age_min or age_max:
+            if self.birth_year is None:
+                return False
+            age = this_year - self.birth_year
+            if (age_min and age < age_min) or (age_max and age > age_max):
+                return False
+        return True
+
+
+class SnapshotStore:
+    """The current snapshot of a directory plus the overlay of later changes."""
+
+    def __init__(self, directory: str, connect, check_interval: float = 5.0, max_age: float = 3600.0):
+        self.directory = directory
+        self.connect = connect
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.snapshot: Optional[Snapshot] = None
+        self._loaded_name = None
+        self._checked = 0.0
+        # replaced, never modified in place, so searches iterate a stable dict
+        self._overlay: Dict[str, OverlayRow] = {}
+        self._stale_since = None
+        self._swap_lock = threading.Lock()
+        self._overlay_lock = threading.Lock()
+
+    def current(self) -> Optional[Snapshot]:
+        """The snapshot to search, or None when search should use SQL."""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval and self._swap_lock.acquire(blocking=False):
+            try:
+                self._checked = now
+                self._maybe_swap()
+            except Exception as e:
+                print(f"[SNAPSHOT ERROR] {e}")
+            finally:
+                self._swap_lock.release()
+        snapshot = self.snapshot
+        if snapshot is None or time.time() - snapshot.built_at > self.max_age:
+            return None
+        if self._stale_since is not None and snapshot.built_at < self._stale_since:
+            return None
+        return snapshot
+
+    def _maybe_swap(self) -> None:
+        private_dir(self.directory)
+        try:
+            with open(os.path.join(self.directory, CURRENT)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return
+        if name == self._loaded_name:
+            return
+        snapshot = Snapshot(os.path.join(self.directory, name))
+
+        # changes logged around the build may be missing from it and, if they
+        # predate this process, were never delivered by the feed
+        with self.connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT DISTINCT entity_id FROM change_log
+                    WHERE entity = 'student' AND created_at >= FROM_UNIXTIME(%s)
+                """, (int(snapshot.built_at) - CATCH_UP_MARGIN,))
+                changed = [row[0] for row in cur.fetchall()]
+        if any(not student_id.isdigit() for student_id in changed):
+            self._mark_stale()
+        loaded = self._load([student_id for student_id in changed if student_id.isdigit()])
+
+        with self._overlay_lock:
+            overlay = {sid: row for sid, row in self._overlay.items() if row.seen_at > snapshot.built_at}
+            for sid, row in loaded.items():
+                if sid not in overlay or overlay[sid].seen_at < row.seen_at:
+                    overlay[sid] = row
+            self._overlay = overlay
+            self.snapshot = snapshot
+        self._loaded_name = name
+        print(f"[SNAPSHOT] loaded {name}: {snapshot.rows} students, {len(overlay)} in overlay")
+
+    def note_change(self, student_id: str) -> None:
+        """Re-read a changed student into the overlay; other entity ids mark a bulk change."""
+        if self.snapshot is None:
+            return
+        if not student_id.isdigit():
+            self._mark_stale()
+            return
+        loaded = self._load([student_id])
+        with self._overlay_lock:
+            row = loaded[student_id]
+            current = self._overlay.get(student_id)
+            if current is None or current.seen_at < row.seen_at:
+                self._overlay = {**self._overlay, student_id: row}
+
+    def _mark_stale(self) -> None:
+        with self.connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT UNIX_TIMESTAMP(NOW(6))")
+                self._stale_since = float(cur.fetchone()[0])
+
+    def _load(self, student_ids: List[str]) -> Dict[str, OverlayRow]:
+        if not student_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(student_ids))
+        with self.connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT {SNAPSHOT_COLUMNS}, s.is_active, UNIX_TIMESTAMP(s.updated_at)
+                    FROM student s WHERE s.student_id IN ({placeholders})
+                """, student_ids)
+                students = {row[0]: row for row in cur.fetchall()}
+                cur.execute(f"""
+                    SELECT si.student_id, it.tag_name, it.category
+                    FROM student_interest si
+                    JOIN interest_tag it ON it.tag_id = si.tag_id
+                    WHERE si.student_id IN ({placeholders})
+                """, student_ids)
+                tags = {}
+                for student_id, tag_name, category in cur.fetchall():
+                    tags.setdefault(student_id, set()).add((tag_name, category))
+                # read last: the rows above are at least as new as this time
+                cur.execute("SELECT UNIX_TIMESTAMP(NOW(6))")
+                seen_at = float(cur.fetchone()[0])
+
+        loaded = {}
+        for student_id in student_ids:
+            found = students.get(student_id)
+            if found is None or not found[-2]:
+                loaded[student_id] = OverlayRow(None, {}, None, frozenset(), seen_at, seen_at)
+                continue
+            row = SnapshotRow._make(found[:-2])
+            card = StudentCard(row.student_id, row.name, row.nickname, row.college, row.year_of_study,
+                               row.major, row.bio)
+            attrs = {col: getattr(row, col) for col in DICT_COLUMNS}
+            loaded[student_id] = OverlayRow(card, attrs, row.birth_year, frozenset(tags.get(student_id, ())),
+                                            float(found[-1]), seen_at)
+        return loaded
+
+    def search(self, filters: Dict, exclude_id: str, hidden: Optional[Iterable[str]], limit: int,
+               offset: int) -> Optional[Tuple[List[StudentCard], int]]:
+        """Same result as dal.search_students, or None when there is no usable snapshot."""
+        snapshot = self.current()
+        if snapshot is None:
+            return None
+        overlay = self._overlay
+        hidden = hidden or ()
+        this_year = date.today().year
+        # edited after the build, so ahead of every snapshot row in updated_at order
+        fresh = sorted((row for sid, row in overlay.items()
+                        if sid != exclude_id and sid not in hidden and row.matches(filters, this_year)),
+                       key=lambda row: row.updated_at, reverse=True)
+        exclude = itertools.chain([exclude_id], hidden, overlay)
+        if offset < len(fresh):
+            page = [row.card for row in fresh[offset:offset + limit]]
+            rest, total = snapshot.search(filters, exclude, limit - len(page), 0)
+            page += rest
+        else:
+            page, total = snapshot.search(filters, exclude, limit, offset - len(fresh))
+        return page, total + len(fresh)
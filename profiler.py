@@ -0,0 +1,270 @@
+# profiler.py
+"""On-demand stack sampling profiler for live requests.
+
+While enabled, the view functions of the selected endpoints are wrapped so that
+a fraction of their requests register the handling thread. A background thread
+snapshots those threads' stacks every ``interval`` seconds and counts them in
+collapsed-stack form (``endpoint;frame;frame... count``), which flamegraph.pl,
+speedscope and similar tools read directly.
+
+Disabling restores the original view functions, so an idle profiler adds no
+per-request cost.
+
+Under a multi-process server the admin request only reaches one worker, so the
+profiler is driven through a private directory instead: start, stop and clear
+write ``control.json`` there, every worker re-reads it at most once per
+``SYNC_INTERVAL`` seconds before a request and follows it, and each worker saves
+its samples to ``samples-<generation>-<pid>.txt``. Downloads and the status page
+add up the files of the current generation, so they cover every worker.
+"""
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+
+from paths import private_dir
+
+MAX_DEPTH = 128
+# Seconds between a worker's checks of the control file
+SYNC_INTERVAL = 1.0
+# Seconds between saves of a running worker's samples
+SAVE_INTERVAL = 1.0
+
+CONTROL_FILE = 'control.json'
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.endpoints = ()
+        self.rate = 0.0
+        self.interval = 0.005
+        self.started_at: Optional[datetime] = None
+        self.samples = 0
+        self.profiled_requests = 0
+        self.directory: Optional[str] = None
+        self.generation = 0
+        self._stacks: Counter = Counter()
+        self._active: Dict[int, str] = {}
+        self._originals: Dict[str, callable] = {}
+        self._app = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def init_app(self, app, directory: str) -> None:
+        """Share control and samples with the other workers through ``directory``."""
+        self._app = app
+        self.directory = private_dir(directory)
+        app.before_request(self.sync)
+
+    # shared control, used by the admin pages
+
+    def start(self, endpoints: Iterable[str], rate: float, interval: float) -> None:
+        self._publish(enabled=True, endpoints=list(endpoints), rate=rate, interval=interval,
+                      started_at=datetime.now().isoformat(timespec='seconds'),
+                      generation=time.time_ns())
+
+    def stop(self) -> None:
+        self._publish(enabled=False)
+
+    def clear(self) -> None:
+        self._publish(generation=time.time_ns())
+
+    def sync(self, force: bool = False) -> None:
+        """Follow the control file if it changed; cheap enough to call per request."""
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced_at < SYNC_INTERVAL:
+            return
+        with self._sync_lock:
+            self._synced_at = now
+            control = self._read_control()
+            if control is None:
+                return
+            if control['generation'] != self.generation:
+                self.reset()
+                self.disable()
+                self.generation = control['generation']
+            if control['enabled'] and not self.enabled:
+                self.enable(self._app, control['endpoints'], control['rate'], control['interval'])
+                self.started_at = datetime.fromisoformat(control['started_at'])
+            elif not control['enabled'] and self.enabled:
+                self.disable()
+
+    def totals(self) -> Tuple[Counter, int, int, int]:
+        """Merged (stacks, profiled requests, samples, workers) of the current generation."""
+        if self.directory is None:
+            with self._lock:
+                return Counter(self._stacks), self.profiled_requests, self.samples, 1
+        self._save()
+        stacks: Counter = Counter()
+        requests = samples = workers = 0
+        for path in glob.glob(os.path.join(self.directory, f'samples-{self.generation}-*.txt')):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    _, file_requests, file_samples = f.readline().split()
+                    file_requests, file_samples = int(file_requests), int(file_samples)
+                    file_stacks = Counter()
+                    for line in f:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        file_stacks[stack] += int(count)
+            except (OSError, ValueError) as e:
+                print(f"[PROFILER ERROR] skipping {path}: {e}")
+                continue
+            stacks.update(file_stacks)
+            requests += file_requests
+            samples += file_samples
+            workers += 1
+        return stacks, requests, samples, workers
+
+    def collapsed(self) -> str:
+        stacks = self.totals()[0]
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+    # this process
+
+    def enable(self, app, endpoints: Iterable[str], rate: float, interval: float) -> None:
+        self.disable()
+        self._app = app
+        self.endpoints = tuple(ep for ep in endpoints if ep in app.view_functions)
+        self.rate = min(max(rate, 0.0), 1.0)
+        self.interval = max(interval, 0.001)
+        self.started_at = datetime.now()
+        for endpoint in self.endpoints:
+            original = app.view_functions[endpoint]
+            self._originals[endpoint] = original
+            app.view_functions[endpoint] = self._wrap(endpoint, original)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def disable(self) -> None:
+        if self._thread is None:
+            return
+        for endpoint, original in self._originals.items():
+            self._app.view_functions[endpoint] = original
+        self._originals = {}
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self._thread = None
+        self._save()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.profiled_requests = 0
+
+    def _wrap(self, endpoint: str, view):
+        @wraps(view)
+        def profiled(*args, **kwargs):
+            if random.random() >= self.rate:
+                return view(*args, **kwargs)
+            tid = threading.get_ident()
+            self._active[tid] = endpoint
+            self.profiled_requests += 1
+            try:
+                return view(*args, **kwargs)
+            finally:
+                self._active.pop(tid, None)
+        return profiled
+
+    def _run(self) -> None:
+        saved_at = time.monotonic()
+        while not self._stop.wait(self.interval):
+            if time.monotonic() - saved_at >= SAVE_INTERVAL:
+                self._save()
+                saved_at = time.monotonic()
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            snapshot = []
+            for tid, endpoint in list(self._active.items()):
+                frame = frames.get(tid)
+                if frame is not None:
+                    snapshot.append(endpoint + ';' + _collapse(frame))
+            with self._lock:
+                for stack in snapshot:
+                    self._stacks[stack] += 1
+                    self.samples += 1
+
+    def _save(self) -> None:
+        """Write this worker's samples for the other workers to merge."""
+        if self.directory is None:
+            return
+        with self._lock:
+            if not self.profiled_requests:
+                return
+            lines = [f"# {self.profiled_requests} {self.samples}\n"]
+            lines.extend(f"{stack} {count}\n" for stack, count in self._stacks.items())
+        path = os.path.join(self.directory, f'samples-{self.generation}-{os.getpid()}.txt')
+        try:
+            _write_atomic(path, ''.join(lines))
+        except OSError as e:
+            print(f"[PROFILER ERROR] could not save samples: {e}")
+
+    def _read_control(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, CONTROL_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[PROFILER ERROR] unreadable control file: {e}")
+            return None
+
+    def _publish(self, **changes) -> None:
+        """Update the control file, drop samples of older generations and follow it here."""
+        control = self._read_control() or {
+            'enabled': False, 'endpoints': [], 'rate': 0.0, 'interval': self.interval,
+            'started_at': None, 'generation': self.generation,
+        }
+        control.update(changes)
+        _write_atomic(os.path.join(self.directory, CONTROL_FILE), json.dumps(control))
+        for path in glob.glob(os.path.join(self.directory, 'samples-*.txt')):
+            if not os.path.basename(path).startswith(f"samples-{control['generation']}-"):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        self.sync(force=True)
+
+
+def _write_atomic(path: str, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        names.append(f"{name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+profiler = SamplingProfiler()
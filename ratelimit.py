@@ -0,0 +1,187 @@
+# ratelimit.py
+"""Token-bucket rate limits for write and login routes.
+
+    @bp.route('/like/<target_id>', methods=['POST'])
+    @rate_limit('like')
+    def like_student(target_id): ...
+
+Each named limit in RATE_LIMITS holds one bucket per user (from the session,
+or the submitted student_id for ``login``) and one per client IP. A request
+goes through only if every one of its buckets has a token, and then takes one
+from each; a rejected request takes none, so once an attacker's IP bucket is
+empty their attempts stop draining the victim's user bucket. A rejected
+request gets a plain-text 429 with Retry-After, before the view runs, so
+rejections never reach the database, bcrypt or a template.
+
+The IP is ``request.remote_addr``. Behind a reverse proxy that is the proxy's
+address, putting every client in one bucket, unless TRUSTED_PROXY_HOPS is set
+so that ProxyFix takes the client address from X-Forwarded-For. Never set it
+without such a proxy: clients could then pick their own address.
+
+Buckets live in process memory by default. Each worker then enforces the
+limits on its own, so the effective limit is N times higher with N workers.
+Set RATE_LIMIT_STORAGE to a ``redis://`` URL (needs the ``redis`` package) to
+share buckets between workers. If Redis is unreachable requests are allowed.
+"""
+import math
+import threading
+import time
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+from flask import Response, request, session
+
+import metrics
+from config import RATE_LIMITS, RATE_LIMIT_STORAGE, RATE_LIMIT_MAX_KEYS
+
+try:
+    import redis
+except ImportError:  # optional
+    redis = None
+
+rate_limit_checks = metrics.Counter('rate_limit_checks_total', 'Rate-limited requests checked.', ('limit',))
+rate_limit_rejections = metrics.Counter('rate_limit_rejections_total', 'Requests rejected with 429.',
+                                        ('limit', 'key'))
+metrics.register(rate_limit_checks)
+metrics.register(rate_limit_rejections)
+
+
+class MemoryStore:
+    """Buckets as ``key -> (tokens, last refill time)`` in one dict."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[Tuple[str, int, float]]) -> List[float]:
+        """Take a token from each ``(key, capacity, period)`` bucket if all have one.
+
+        Returns the seconds until each bucket has a token, all 0 when the tokens were taken.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            waits = []
+            for key, capacity, period in buckets:
+                rate = capacity / period
+                tokens, stamp = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - stamp) * rate)
+                levels.append(tokens)
+                waits.append(0.0 if tokens >= 1 else (1 - tokens) / rate)
+            if any(waits):
+                return waits
+            if len(self._buckets) + len(buckets) > self.max_keys:
+                self._sweep(now)
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1, now)
+            return waits
+
+    def _sweep(self, now: float) -> None:
+        # Buckets idle for longer than any period are full again, the same as absent.
+        longest = max(period for limits in RATE_LIMITS.values() for _, period in limits.values())
+        idle = [k for k, (_, stamp) in self._buckets.items() if now - stamp > longest]
+        for k in idle:
+            del self._buckets[k]
+        if len(self._buckets) >= self.max_keys:
+            # still full: drop the oldest insertions
+            for k in list(self._buckets)[:self.max_keys // 10]:
+                del self._buckets[k]
+
+
+# ARGV holds capacity and rate for each key in turn; returns each bucket's wait as a string
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local levels, waits, allowed = {}, {}, true
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local b = redis.call('HMGET', key, 'tokens', 'stamp')
+    levels[i] = math.min(capacity, (tonumber(b[1]) or capacity) + (now - (tonumber(b[2]) or now)) * rate)
+    waits[i] = '0'
+    if levels[i] < 1 then
+        waits[i] = tostring((1 - levels[i]) / rate)
+        allowed = false
+    end
+end
+if allowed then
+    for i, key in ipairs(KEYS) do
+        local capacity, rate = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+        redis.call('HSET', key, 'tokens', levels[i] - 1, 'stamp', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+end
+return waits
+"""
+
+
+class RedisStore:
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_STORAGE is a redis:// URL but the redis package is not installed")
+        self._take = redis.Redis.from_url(url, socket_timeout=0.05).register_script(_TAKE_SCRIPT)
+
+    def take(self, buckets: List[Tuple[str, int, float]]) -> List[float]:
+        args = []
+        for _, capacity, period in buckets:
+            args += [capacity, capacity / period]
+        try:
+            waits = self._take(keys=['ratelimit:' + key for key, _, _ in buckets], args=args)
+            return [float(wait) for wait in waits]
+        except Exception as e:
+            print(f"[RATELIMIT ERROR] {e}")
+            return [0.0] * len(buckets)
+
+
+def _make_store(storage: str):
+    if storage.startswith('redis://') or storage.startswith('rediss://'):
+        return RedisStore(storage)
+    return MemoryStore(RATE_LIMIT_MAX_KEYS)
+
+
+store = _make_store(RATE_LIMIT_STORAGE)
+
+
+def _key_values(name: str) -> Dict[str, Optional[str]]:
+    if name == 'login':
+        user = request.form.get('student_id', '').strip() or request.form.get('user_id', '').strip()
+    else:
+        user = session.get('user_id')
+    return {'user': user or None, 'ip': request.remote_addr}
+
+
+def check(name: str) -> float:
+    """Take a token from every bucket of limit ``name``; returns the longest wait (0 if allowed)."""
+    rate_limit_checks.inc(name)
+    values = _key_values(name)
+    kinds = []
+    buckets = []
+    for kind, (capacity, period) in RATE_LIMITS[name].items():
+        value = values.get(kind)
+        if value is not None:
+            kinds.append(kind)
+            buckets.append((f"{name}:{kind}:{value}", capacity, period))
+    waits = store.take(buckets) if buckets else []
+    for kind, wait in zip(kinds, waits):
+        if wait:
+            rate_limit_rejections.inc(name, kind)
+    return max(waits, default=0.0)
+
+
+def rate_limit(name: str, methods: Tuple[str, ...] = ('POST',)):
+    """Reject requests over limit ``name`` of RATE_LIMITS with 429."""
+    if name not in RATE_LIMITS:
+        raise KeyError(f"no rate limit named {name!r} in RATE_LIMITS")
+
+    def decorator(view):
+        @wraps(view)
+        def limited(*args, **kwargs):
+            if request.method in methods:
+                wait = check(name)
+                if wait:
+                    return Response("Too many requests, please slow down.\n", status=429,
+                                    mimetype='text/plain',
+                                    headers={'Retry-After': str(math.ceil(wait))})
+            return view(*args, **kwargs)
+        return limited
+    return decorator
@@ -0,0 +1,27 @@
+# rows.py
+"""Compact row types for list views.
+
+List queries project exactly these columns, in this order, and read them with a
+plain tuple cursor. A namedtuple row costs the same memory as a bare tuple and
+has no per-row dict, while templates keep using ``row.field`` attribute access.
+"""
+from collections import namedtuple
+
+# search result cards; bio is truncated by the query
+StudentCard = namedtuple('StudentCard', [
+    'student_id', 'name', 'nickname', 'college', 'year_of_study', 'major', 'bio'
+])
+STUDENT_CARD_COLUMNS = ("s.student_id, s.name, s.nickname, s.college, s.year_of_study, "
+                        "s.major, LEFT(s.bio, 200) AS bio")
+
+SentInvitationRow = namedtuple('SentInvitationRow', [
+    'id', 'status', 'created_at', 'to_name', 'to_nickname', 'to_wechat_id'
+])
+ReceivedInvitationRow = namedtuple('ReceivedInvitationRow', [
+    'id', 'status', 'created_at', 'from_name', 'from_nickname', 'wechat_id'
+])
+
+ReportQueueRow = namedtuple('ReportQueueRow', [
+    'reported_id', 'report_count', 'reporter_count', 'first_reported_at',
+    'last_reported_at', 'priority', 'reported_name', 'reported_nickname'
+])
@@ -0,0 +1,115 @@
+# search_query.py
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+# Filter name -> WHERE fragment. Order matters: parameters are bound in this order.
+SEARCH_FILTERS = (
+    ('college', "s.college = %s"),
+    ('identity', "s.identity = %s"),
+    ('major', "s.major = %s"),
+    ('hometown', "s.hometown = %s"),
+    ('gender', "s.gender = %s"),
+    ('mbti', """EXISTS (
+        SELECT 1 FROM student_interest si
+        JOIN interest_tag it ON si.tag_id = it.tag_id
+        WHERE si.student_id = s.student_id AND it.tag_name = %s AND it.category = 'MBTI'
+    )"""),
+    ('age_min', "(YEAR(CURDATE()) - YEAR(s.birth_date)) >= %s"),
+    ('age_max', "(YEAR(CURDATE()) - YEAR(s.birth_date)) <= %s"),
+)
+
+
+class CompiledSearch(NamedTuple):
+    count_sql: str
+    page_sql: str
+
+
+def search_signature(filters: Dict) -> Tuple[str, ...]:
+    """Names of the filters that are set; every signature maps to one SQL text."""
+    return tuple(name for name, _ in SEARCH_FILTERS if filters.get(name))
+
+
+@lru_cache(maxsize=256)
+def compile_search(signature: Tuple[str, ...], columns: str = 's.*',
+                   window_count: bool = True, exclude_slots: int = 0) -> CompiledSearch:
+    """Build the COUNT and page statements for one filter signature.
+
+    With ``window_count`` the page query also returns ``total_count`` via
+    ``COUNT(*) OVER()`` so a non-empty page needs a single round trip.
+    ``exclude_slots`` adds a constant ``NOT IN`` list of that many ids, bound
+    after the filter parameters (see ``exclusion_params``).
+    """
+    clauses = dict(SEARCH_FILTERS)
+    where = " WHERE s.is_active = 1 AND s.student_id != %s"
+    for name in signature:
+        where += " AND " + clauses[name]
+    if exclude_slots:
+        where += " AND s.student_id NOT IN (" + ", ".join(["%s"] * exclude_slots) + ")"
+
+    count_sql = "SELECT COUNT(*) AS total FROM student s" + where
+    select = columns + (", COUNT(*) OVER() AS total_count" if window_count else "")
+    page_sql = (f"SELECT {select} FROM student s" + where +
+                " ORDER BY s.updated_at DESC LIMIT %s OFFSET %s")
+    return CompiledSearch(count_sql, page_sql)
+
+
+def search_params(signature: Tuple[str, ...], filters: Dict, exclude_id: str) -> List:
+    return [exclude_id] + [filters[name] for name in signature]
+
+
+class ExclusionSet:
+    """Student ids a user has already handled, as a sorted array of 32-bit ints.
+
+    Student ids are 8-digit numbers, so each one costs 4 bytes instead of a
+    str object in a set. Instances are never modified in place; ``with_added``
+    returns a copy, so readers in other threads always see a consistent array.
+    """
+    __slots__ = ('_ids',)
+
+    def __init__(self, ids: Iterable[str] = ()):
+        self._ids = array('I', sorted({int(i) for i in ids if _is_numeric_id(i)}))
+
+    def __contains__(self, student_id: str) -> bool:
+        if not _is_numeric_id(student_id):
+            return False
+        value = int(student_id)
+        idx = bisect_left(self._ids, value)
+        return idx < len(self._ids) and self._ids[idx] == value
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return (str(i) for i in self._ids)
+
+    def with_added(self, student_id: str) -> 'ExclusionSet':
+        if student_id in self or not _is_numeric_id(student_id):
+            return self
+        copy = ExclusionSet()
+        copy._ids = array('I', self._ids)
+        copy._ids.insert(bisect_left(copy._ids, int(student_id)), int(student_id))
+        return copy
+
+
+def _is_numeric_id(student_id: str) -> bool:
+    # ids with a leading zero would not survive the int round trip
+    return student_id.isdigit() and student_id[0] != '0' and len(student_id) <= 9
+
+
+def exclusion_slots(count: int) -> int:
+    """Placeholder count for ``count`` excluded ids, rounded up to a power of two.
+
+    Rounding keeps the number of distinct statement texts (and compile_search
+    cache entries) logarithmic in the largest exclusion set.
+    """
+    if count == 0:
+        return 0
+    return max(8, 1 << (count - 1).bit_length())
+
+
+def exclusion_params(excluded: ExclusionSet, exclude_id: str) -> List[str]:
+    """Excluded ids padded to ``exclusion_slots`` with ``exclude_id``, which is filtered out anyway."""
+    ids = list(excluded)
+    return ids + [exclude_id] * (exclusion_slots(len(ids)) - len(ids))
@@ -0,0 +1,43 @@
+// static/js/notifications.js
+// Listens on /matching/events and shows invitations, responses and likes as they happen.
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+    var script = document.currentScript;
+    var badge = document.getElementById('pending-invitation-badge');
+    var container = document.getElementById('live-notifications');
+    var source = new EventSource(script.getAttribute('data-events-url'));
+
+    function show(category, text) {
+        var alert = document.createElement('div');
+        alert.className = 'alert alert-' + category + ' alert-dismissible fade show';
+        alert.textContent = text;
+        var close = document.createElement('button');
+        close.type = 'button';
+        close.className = 'btn-close';
+        close.setAttribute('data-bs-dismiss', 'alert');
+        alert.appendChild(close);
+        container.prepend(alert);
+    }
+
+    source.addEventListener('invitation', function (e) {
+        var data = JSON.parse(e.data);
+        badge.textContent = (parseInt(badge.textContent, 10) || 0) + 1;
+        badge.hidden = false;
+        show('info', 'New invitation from ' + data.from + '.');
+    });
+
+    source.addEventListener('invitation_response', function (e) {
+        var data = JSON.parse(e.data);
+        if (data.status === 'accepted') {
+            show('success', data.by + ' accepted your invitation!');
+        } else {
+            show('secondary', data.by + ' declined your invitation.');
+        }
+    });
+
+    source.addEventListener('like', function (e) {
+        show('info', JSON.parse(e.data).from + ' liked your profile.');
+    });
+})();
@@ -0,0 +1,91 @@
+# warmup.py
+"""Template bytecode cache, startup warmup and the ``/readyz`` endpoint.
+
+Compiling a large template costs far more than rendering it. With a bytecode
+cache directory the compiled code is written to disk once and reused by every
+worker and across restarts, until the template source changes.
+
+The warmup step runs in a background thread so the process starts serving
+straight away. It compiles every template and loads the tag catalog, the
+search facet index and the profile snapshot. ``/readyz`` answers 503 until
+every step has finished, so a load balancer only routes traffic to a
+warmed-up worker. With warmup disabled those things load lazily and
+``/readyz`` reports ready immediately.
+"""
+import threading
+import time
+
+from flask import jsonify
+from jinja2 import FileSystemBytecodeCache
+
+from paths import private_dir
+
+
+class Readiness:
+    def __init__(self):
+        self.steps = {}
+        self._lock = threading.Lock()
+
+    def pending(self, name: str) -> None:
+        with self._lock:
+            self.steps[name] = None
+
+    def done(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.steps[name] = round(seconds, 3)
+
+    @property
+    def ready(self) -> bool:
+        return all(seconds is not None for seconds in self.steps.values())
+
+
+readiness = Readiness()
+
+
+def precompile_templates(app) -> int:
+    """Load every template into the environment cache (and the bytecode cache)."""
+    env = app.jinja_env
+    names = env.list_templates(extensions=('html',))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def _run_steps(steps) -> None:
+    for name, step in steps:
+        # A step that keeps failing (e.g. the database is down) is retried, and
+        # the worker stays unready, rather than being reported as loaded.
+        while True:
+            start = time.perf_counter()
+            try:
+                step()
+                break
+            except Exception as e:
+                print(f"[WARMUP ERROR] {name}: {e}")
+                time.sleep(5)
+        readiness.done(name, time.perf_counter() - start)
+
+
+def init_app(app, bytecode_cache_dir=None, warmup: bool = True) -> None:
+    """Attach the bytecode cache, start the warmup and register ``/readyz``."""
+    if bytecode_cache_dir:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(private_dir(bytecode_cache_dir))
+
+    @app.route('/readyz')
+    def readyz():
+        body = {'ready': readiness.ready, 'steps': dict(readiness.steps)}
+        return jsonify(body), 200 if body['ready'] else 503
+
+    if not warmup:
+        return
+
+    from dal import get_active_tags, warm_search_facets, warm_profile_snapshot
+    steps = [
+        ('templates', lambda: precompile_templates(app)),
+        ('tag_catalog', get_active_tags),
+        ('search_facets', warm_search_facets),
+        ('profile_snapshot', warm_profile_snapshot),
+    ]
+    for name, _ in steps:
+        readiness.pending(name)
+    threading.Thread(target=_run_steps, args=(steps,), name='warmup', daemon=True).start()
@@ -0,0 +1,94 @@
+# write_behind.py
+import atexit
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class WriteBehindQueue:
+    """Coalescing write-behind buffer flushed by a background thread.
+
+    Repeated writes to the same key collapse into the latest value, so a burst of
+    toggles costs at most one row write per flush. Each entry also remembers the
+    value the database held before the first buffered write (``base``), which lets
+    readers compute deltas against what is already persisted.
+    """
+
+    def __init__(self, flush_batch: Callable[[List[Tuple[Hashable, str]]], None],
+                 interval: float = 0.5, heartbeat: Optional[Callable[[], object]] = None):
+        self.flush_batch = flush_batch
+        self.interval = interval
+        # called by the flush thread every interval, even with nothing to write
+        self.heartbeat = heartbeat
+        self._pending: Dict[Hashable, Tuple[str, Optional[str]]] = {}
+        self._inflight: Dict[Hashable, Tuple[str, Optional[str]]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def put(self, key: Hashable, value: str, base: Optional[str] = None) -> None:
+        with self._lock:
+            previous = self._pending.get(key)
+            if previous is not None:
+                base = previous[1]
+            self._pending[key] = (value, base)
+        if self._thread is None:
+            self.start()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """Latest buffered value for ``key``, or None if nothing is waiting to be written."""
+        entry = self._pending.get(key) or self._inflight.get(key)
+        return entry[0] if entry else None
+
+    def entries(self) -> List[Tuple[Hashable, str, Optional[str]]]:
+        """Snapshot of buffered writes as ``(key, value, base)`` triples, oldest first."""
+        with self._lock:
+            merged = list(self._inflight.items()) + list(self._pending.items())
+        return [(key, value, base) for key, (value, base) in merged]
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+            # sorted keys make concurrent flushers lock rows in the same order
+            batch = sorted((key, value) for key, (value, _) in self._inflight.items())
+            try:
+                self.flush_batch(batch)
+            except Exception as e:
+                print(f"[DAL ERROR] write-behind flush failed: {e}")
+                with self._lock:
+                    for key, entry in self._inflight.items():
+                        if key in self._pending:
+                            self._pending[key] = (self._pending[key][0], entry[1])
+                        else:
+                            self._pending[key] = entry
+                    self._inflight = {}
+                return 0
+            with self._lock:
+                self._inflight = {}
+            return len(batch)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.interval * 4)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self.heartbeat is not None:
+                try:
+                    self.heartbeat()
+                except Exception as e:
+                    print(f"[DAL ERROR] write-behind heartbeat failed: {e}")
+            self.flush()